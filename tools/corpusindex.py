@@ -0,0 +1,314 @@
+"""
+Persistent index of the PInSoRo records.
+
+Selecting records (for instance with ``dataset_stats --filter``) requires the
+meta-data of every record: condition, participants, duration... Reading them
+means parsing, for each of the records, the ``experiment.yaml`` and
+``freeplay.bag.yaml`` files, and looking for the annotation files.
+
+This module stores these meta-data in a SQLite database (by default, a
+``.pinsoro-index.sqlite`` file at the root of the dataset). The index is
+updated incrementally: a record is only parsed again if one of its meta-data
+files (or the list of its files) has changed since the last update, which is
+detected with the files modification times. Queries are then answered without
+touching the YAML files.
+
+Typical usage:
+
+    from corpusindex import CorpusIndex
+
+    index = CorpusIndex("$DATASET")
+    index.update()
+    for path in index.filter("condition == 'childchild' and age1 == 6"):
+        print(path)
+
+License: CC-0
+"""
+
+import logging
+import os
+import os.path
+import json
+import sqlite3
+
+import yaml
+
+CHILDCHILD = "childchild"
+CHILDROBOT = "childrobot"
+
+# name of the index database, created at the root of the dataset
+INDEX_FILENAME = ".pinsoro-index.sqlite"
+
+# version of the index format. Bump it whenever the tables change, so that
+# existing indices get rebuilt.
+INDEX_VERSION = 1
+
+ANNOTATIONS_PREFIX = "freeplay.annotations."
+
+# sub-directories of the records whose files are listed in the index
+SUBDIRS = ["audio", "videos"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    path TEXT PRIMARY KEY, -- path of the record, relative to the dataset root
+    signature TEXT,        -- modification times of the record's meta-data
+    condition TEXT,
+    start REAL,            -- UNIX timestamp of the start of the bag file
+    duration REAL,         -- duration of the bag file (s)
+    age1 INTEGER, gender1 TEXT, familiarity1 INTEGER,
+    age2 INTEGER, gender2 TEXT, familiarity2 INTEGER,
+    annotators TEXT        -- '+'-separated names of the annotators
+);
+CREATE TABLE IF NOT EXISTS topics (
+    path TEXT,
+    topic TEXT,
+    messages INTEGER,
+    frequency REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT,
+    name TEXT,             -- path of the file, relative to the record
+    size INTEGER
+);
+CREATE INDEX IF NOT EXISTS topics_path ON topics (path);
+CREATE INDEX IF NOT EXISTS files_path ON files (path);
+"""
+
+
+def find_records(root):
+    """ Returns the paths (relative to 'root') of all the records of the
+    dataset, ie the directories containing an experiment.yaml file. Records
+    in directories starting with 'exclude_' are skipped.
+    """
+    records = []
+
+    for dirpath, dirs, files in os.walk(root):
+        if "experiment.yaml" in files:
+            if os.path.basename(dirpath).startswith("exclude_"):
+                logging.info("%s has been excluded" % dirpath)
+            else:
+                records.append(os.path.relpath(dirpath, root))
+            # records do not contain other records
+            dirs[:] = []
+
+    return sorted(records)
+
+
+def list_files(recordpath):
+    """ Returns the list of (name, size) of the files of a record (top-level
+    files and files in SUBDIRS).
+    """
+    files = []
+
+    for subdir in [""] + SUBDIRS:
+        path = os.path.join(recordpath, subdir)
+        if not os.path.isdir(path):
+            continue
+        for entry in os.scandir(path):
+            if entry.is_file():
+                files.append((os.path.join(subdir, entry.name), entry.stat().st_size))
+
+    return files
+
+
+def signature(recordpath):
+    """ Returns a string that changes whenever the meta-data of a record
+    change: modification times of the record's directories (that change when
+    files are added or removed) and of the YAML files.
+    """
+    mtimes = {}
+
+    for subdir in [""] + SUBDIRS:
+        path = os.path.join(recordpath, subdir)
+        if os.path.isdir(path):
+            mtimes[subdir] = os.stat(path).st_mtime_ns
+
+    for entry in os.scandir(recordpath):
+        if entry.name.endswith(".yaml"):
+            mtimes[entry.name] = entry.stat().st_mtime_ns
+
+    return json.dumps(mtimes, sort_keys=True)
+
+
+def familiarity(participant):
+    """ Returns the self-reported familiarity of a participant with tablets,
+    or None if unknown.
+    """
+    value = (participant.get("details") or {}).get("tablet-familiarity")
+    return value if isinstance(value, int) else None
+
+
+class CorpusIndex:
+    """ SQLite index of the records of the dataset.
+
+    :param root: root path of the dataset. Records are recursively looked for
+                 from this path.
+    :param dbpath: path of the SQLite database. By default, INDEX_FILENAME at
+                   the root of the dataset.
+    """
+
+    def __init__(self, root, dbpath=None):
+
+        self.root = root
+
+        if dbpath is None:
+            dbpath = os.path.join(root, INDEX_FILENAME)
+
+        self.db = sqlite3.connect(dbpath)
+
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_VERSION:
+            logging.info("Creating the dataset index %s" % dbpath)
+            self.db.executescript("DROP TABLE IF EXISTS records; DROP TABLE IF EXISTS topics; DROP TABLE IF EXISTS files;")
+            self.db.executescript(SCHEMA)
+            self.db.execute("PRAGMA user_version = %d" % INDEX_VERSION)
+            self.db.commit()
+
+    def update(self):
+        """ Updates the index: new records and records whose meta-data have
+        changed are (re-)parsed; records that do not exist anymore are
+        removed.
+
+        :returns: the number of records that have been (re-)parsed and the
+                  number of records that have been removed.
+        """
+
+        indexed = dict(self.db.execute("SELECT path, signature FROM records"))
+
+        records = []
+        for path in find_records(self.root):
+            # as in dataset_stats, the records without a description of
+            # their bag file are left out
+            if os.path.exists(os.path.join(self.root, path, "freeplay.bag.yaml")):
+                records.append(path)
+            else:
+                logging.warning("%s: missing freeplay.bag.yaml (cf generate_yaml_bag_description). Record not indexed." % path)
+
+        nb_updated = 0
+        for path in records:
+            sig = signature(os.path.join(self.root, path))
+            if indexed.get(path) != sig:
+                logging.debug("Indexing %s" % path)
+                self.index(path, sig)
+                nb_updated += 1
+
+        removed = set(indexed) - set(records)
+        for path in removed:
+            logging.debug("Removing %s from the index" % path)
+            self.remove(path)
+
+        self.db.commit()
+
+        if nb_updated or removed:
+            logging.info("Dataset index updated (%d records indexed, %d removed)" % (nb_updated, len(removed)))
+
+        return nb_updated, len(removed)
+
+    def remove(self, path):
+        for table in ["records", "topics", "files"]:
+            self.db.execute("DELETE FROM %s WHERE path=?" % table, (path,))
+
+    def index(self, path, sig):
+        """ Parses the meta-data of the record 'path' and stores them in the
+        index.
+        """
+
+        recordpath = os.path.join(self.root, path)
+
+        with open(os.path.join(recordpath, "experiment.yaml"), 'r') as yml:
+            expe = yaml.safe_load(yml)
+
+        with open(os.path.join(recordpath, "freeplay.bag.yaml"), 'r') as yml:
+            bagfile = yaml.safe_load(yml)
+
+        files = list_files(recordpath)
+
+        annotators = sorted(name[len(ANNOTATIONS_PREFIX):-len(".yaml")] for name, size in files
+                                        if name.startswith(ANNOTATIONS_PREFIX) and name.endswith(".yaml"))
+
+        purple = expe["purple-participant"]
+        yellow = expe.get("yellow-participant") if expe["condition"] == CHILDCHILD else None
+
+        self.remove(path)
+
+        self.db.execute("INSERT INTO records VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                        (path,
+                         sig,
+                         expe["condition"],
+                         bagfile.get("start"),
+                         bagfile.get("duration"),
+                         purple["age"], purple["gender"], familiarity(purple),
+                         yellow["age"] if yellow else None,
+                         yellow["gender"] if yellow else None,
+                         familiarity(yellow) if yellow else None,
+                         "+".join(annotators)))
+
+        self.db.executemany("INSERT INTO topics VALUES (?,?,?,?)",
+                            [(path, t["topic"], t.get("messages"), t.get("frequency")) for t in bagfile.get("topics", [])])
+
+        self.db.executemany("INSERT INTO files VALUES (?,?,?)",
+                            [(path, name, size) for name, size in files])
+
+    def records(self):
+        """ Returns the list of the indexed records, as dictionaries with the
+        same variables as the ones available in filter expressions (cf
+        'filter').
+        """
+
+        topics = {}
+        for path, topic, messages in self.db.execute("SELECT path, topic, messages FROM topics"):
+            topics.setdefault(path, {})[topic] = messages
+
+        files = {}
+        for path, name in self.db.execute("SELECT path, name FROM files"):
+            files.setdefault(path, set()).add(name)
+
+        records = []
+        for row in self.db.execute("SELECT path, condition, start, duration, "
+                                   "age1, gender1, familiarity1, age2, gender2, familiarity2, annotators "
+                                   "FROM records ORDER BY path"):
+            path, cdt, start, duration, age1, gender1, fam1, age2, gender2, fam2, annotators = row
+            record_files = files.get(path, set())
+
+            records.append({
+                "path": os.path.join(self.root, path),
+                "id": os.path.basename(path),
+                "condition": cdt,
+                "cdt": cdt,
+                "start": start or 0,
+                "duration": duration or 0,
+                "age1": age1,
+                "age2": age2 or 0,
+                "age": (age1 + age2) / 2.0 if cdt == CHILDCHILD else age1,
+                "gender1": gender1,
+                "gender2": gender2 or "",
+                "familiarity1": fam1,
+                "familiarity2": fam2,
+                "annotators": annotators.split("+") if annotators else [],
+                "messages": topics.get(path, {}),
+                "has": (lambda f, record_files=record_files: f in record_files),
+                })
+
+        return records
+
+    def filter(self, expr):
+        """ Returns the paths of the records matching the Python expression
+        'expr'.
+
+        The following variables can be used in the expression: `age`
+        (average age of the participants), `age1`, `age2` (ages of each of the
+        participants), `gender1`, `gender2` (either `male` or `female`),
+        `familiarity1`, `familiarity2` (familiarity with tablets, from 0 to 2,
+        or None if unknown), `duration` (in seconds), `start` (UNIX
+        timestamp), `condition` (`childchild` or `childrobot`), `annotators`
+        (list of the annotators' names), `messages` (dictionary of the number
+        of messages per topic of the bag file), and `has(<file>)` (whether the
+        record contains a given file, eg `has('videos/camera_purple_raw.mkv')`).
+        """
+
+        # the variables are passed as globals, so that they are also visible
+        # from generator expressions or lambdas in 'expr'
+        return [r["path"] for r in self.records() if eval(expr, dict(r))]
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
@@ -0,0 +1,255 @@
+"""
+Memory-mapped frame store for the PInSoRo records.
+
+A frame store holds all the frames of one ``pinsoro-*.csv`` record as a
+single, row-major, fixed-stride matrix of 32-bit floats (one row per frame,
+one column per CSV field), saved as a ``.npy`` file and memory-mapped when
+opened. A small JSON column directory maps the field names to column indices
+(and stores the categories of the string fields, which are stored as integer
+codes in the matrix). Timestamps, which require 64-bit precision, are stored
+in a separate array.
+
+Since the matrix is memory-mapped, opening a store is instantaneous and does
+not load the record in memory; reading any frame, or any range of frames, is
+a zero-copy numpy view, and costs the same wherever it is in the recording.
+
+The store is built (once) from the binary cache of the record (cf
+pinsoro.py), and lives next to it, keyed on the same checksum.
+
+'open_corpus' opens the stores of several records at once, building the
+missing ones in parallel, in a pool of processes. The workers only send back
+the location of the stores, that are then memory-mapped by the calling
+process: no data is copied between processes.
+
+Typical usage:
+
+    from framestore import FrameStore
+
+    store = FrameStore("<path to record>/pinsoro-<id>.csv")
+    row = store.frame(12000)
+    head_x = store.column("purple_child_head_x", 12000, 12300)
+    faces = store.keypoints("purple", "face") # (frames, 70, 2) view
+
+License: CC-0
+"""
+
+import logging
+import os
+import json
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+import pinsoro
+import schema
+
+FRAMES_SUFFIX = ".frames.npy"
+TIMESTAMPS_SUFFIX = ".timestamps.npy"
+DIRECTORY_SUFFIX = ".frames.json"
+
+
+def build(path, prefix, cachedir=None):
+    """ Creates the frame store of the CSV file 'path', with files named
+    '<prefix><suffix>' (cf FRAMES_SUFFIX, TIMESTAMPS_SUFFIX,
+    DIRECTORY_SUFFIX).
+
+    The column directory is written last: its presence means that the store
+    is complete.
+    """
+
+    data = pinsoro.load(path, cachedir=cachedir)
+
+    logging.info("Building the frame store of %s (this is only done once)..." % path)
+
+    columns = [c for c in data.columns if c != "timestamp"]
+    categories = {}
+
+    framesfile = prefix + FRAMES_SUFFIX
+    tmpfile = pinsoro.tmp_path(framesfile)
+    frames = np.lib.format.open_memmap(tmpfile, mode="w+", dtype=np.float32, shape=(len(data), len(columns)))
+
+    for i, col in enumerate(columns):
+        values = data[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            frames[:, i] = values.cat.codes.values
+            categories[col] = [str(c) for c in values.cat.categories]
+        else:
+            frames[:, i] = values.values
+
+    frames.flush()
+    del frames
+    os.replace(tmpfile, framesfile)
+
+    timestampsfile = prefix + TIMESTAMPS_SUFFIX
+    tmpfile = pinsoro.tmp_path(timestampsfile)
+    np.save(tmpfile, data["timestamp"].values.astype(np.float64))
+    os.replace(tmpfile, timestampsfile)
+
+    directoryfile = prefix + DIRECTORY_SUFFIX
+    tmpfile = pinsoro.tmp_path(directoryfile)
+    with open(tmpfile, 'w') as f:
+        json.dump({"columns": columns, "categories": categories}, f)
+    os.replace(tmpfile, directoryfile)
+
+    logging.debug("%s successfully saved." % framesfile)
+
+
+class FrameStore:
+    """ Memory-mapped frames of one record.
+
+    :param path: path to the pinsoro-*.csv file. The store is created if it
+                 does not exist yet (or if the CSV checksum has changed).
+    :param cachedir: where to store the caches (cf pinsoro.cache_path)
+    :param prefix: the prefix of the store files, if already known (saves the
+                   checksum lookup)
+    """
+
+    def __init__(self, path, cachedir=None, prefix=None):
+
+        self.path = path
+
+        if prefix is None:
+            prefix = pinsoro.cache_path(path, cachedir, suffix="")
+        self.prefix = prefix
+
+        if not os.path.exists(prefix + DIRECTORY_SUFFIX):
+            build(path, prefix, cachedir)
+
+        with open(prefix + DIRECTORY_SUFFIX, 'r') as f:
+            directory = json.load(f)
+
+        self.columns = directory["columns"]
+        self.categories = directory["categories"]
+        self.index = {c: i for i, c in enumerate(self.columns)}
+
+        self.frames = np.load(prefix + FRAMES_SUFFIX, mmap_mode='r')
+        self.timestamps = np.load(prefix + TIMESTAMPS_SUFFIX, mmap_mode='r')
+
+        # decoded annotations, cf 'annotations'
+        self._annotations = {}
+
+    def __len__(self):
+        return self.frames.shape[0]
+
+    def frame(self, idx):
+        """ Returns the row of frame 'idx' (a view on the store).
+        """
+        return self.frames[idx]
+
+    def range(self, start, stop):
+        """ Returns the rows of the frames [start, stop) (a view on the store).
+        """
+        return self.frames[start:stop]
+
+    def column(self, name, start=None, stop=None):
+        """ Returns the values of field 'name' for the frames [start, stop)
+        (by default, the whole record), as a (strided) view on the store.
+        """
+        return self.frames[start:stop, self.index[name]]
+
+    def value(self, idx, name):
+        """ Returns the value of field 'name' at frame 'idx'.
+        """
+        return self.frames[idx, self.index[name]]
+
+    def keypoints(self, child, group="face"):
+        """ Returns the 2D keypoints of one child, for the whole record, as a
+        (frames, points, 2) array of normalised (x, y) coordinates.
+
+        The array is a read-only view on the store (no data is copied).
+
+        :param child: 'purple' or 'yellow'
+        :param group: 'face' (70 facial landmarks) or 'skeleton' (18 skeleton
+                      keypoints)
+        """
+        if group == "face":
+            nb_points = schema.NUM_FACIAL_LANDMARKS
+        elif group == "skeleton":
+            nb_points = schema.NUM_SKELETON_KEYPOINTS
+        else:
+            raise ValueError("keypoints are only available for the 'face' and 'skeleton' groups, not '%s'" % group)
+
+        first = self.index[schema.group_fields(group, child)[0]]
+        itemsize = self.frames.itemsize
+
+        # the (x, y) coordinates of the keypoints are stored next to each
+        # other in each row: only the strides of the view need to change
+        return np.lib.stride_tricks.as_strided(self.frames[:, first:],
+                                               shape=(len(self), nb_points, 2),
+                                               strides=(self.frames.strides[0], 2 * itemsize, itemsize),
+                                               writeable=False)
+
+    def annotations(self, child, construct):
+        """ Returns the annotations of one child for one construct, decoded
+        into integer codes (cf pinsoro.decode_annotations). The annotations are
+        only decoded once.
+
+        :param child: 'purple' or 'yellow'
+        :param construct: 'task_engagement', 'social_engagement' or
+                          'social_attitude'
+
+        :returns: (labels, disagreement): 'labels' is a (frames, n) int8
+                  array of indices in the construct's vocabulary (cf
+                  timeline.py), -1 where no label; 'disagreement' is True for
+                  the frames where the annotators disagreed.
+
+        For instance, the frames where the purple child was annotated
+        'goaloriented' by (at least one of) the annotators:
+
+            labels, _ = store.annotations("purple", "task_engagement")
+            frames = (labels == timeline.TASKENGAGEMENT.index(timeline.GOALORIENTED)).any(axis=1)
+        """
+        field = "%s_child_%s" % (child, construct)
+
+        if field not in self._annotations:
+            self._annotations[field] = pinsoro.decode_annotations(self.column(field),
+                                                                  self.categories[field],
+                                                                  pinsoro.vocabulary(field))
+        return self._annotations[field]
+
+    def label(self, idx, name):
+        """ Returns the value of the string field 'name' at frame 'idx', or
+        None if the value is missing.
+        """
+        code = int(self.frames[idx, self.index[name]])
+        if code < 0:
+            return None
+        return self.categories[name][code]
+
+    def __repr__(self):
+        return "frame store of %s (%d frames, %d fields)" % (self.path, len(self), len(self.columns))
+
+
+def _prepare(args):
+    """ Worker of open_corpus: creates (if needed) the frame store of a record,
+    and returns its prefix.
+    """
+    path, cachedir = args
+    return FrameStore(path, cachedir).prefix
+
+
+def open_corpus(paths, processes=None, cachedir=None):
+    """ Opens the frame stores of several records.
+
+    The stores that do not exist yet are built in parallel, by a pool of
+    'processes' processes (by default, one per CPU core). Each worker parses
+    one CSV file at a time, and writes the resulting store to disk; the
+    stores are then memory-mapped by the calling process.
+
+    :param paths: list of paths to pinsoro-*.csv files
+    :param processes: number of worker processes
+    :param cachedir: where to store the caches (cf pinsoro.cache_path)
+
+    :returns: the list of FrameStore, in the same order as 'paths'
+    """
+
+    if processes == 1 or len(paths) <= 1:
+        return [FrameStore(path, cachedir) for path in paths]
+
+    logging.info("Opening %d records with %s processes..." % (len(paths), processes or multiprocessing.cpu_count()))
+
+    with multiprocessing.Pool(processes) as pool:
+        prefixes = pool.map(_prepare, [(path, cachedir) for path in paths], chunksize=1)
+
+    return [FrameStore(path, prefix=prefix) for path, prefix in zip(paths, prefixes)]
@@ -0,0 +1,275 @@
+"""
+Vectorised geometry over whole PInSoRo records.
+
+The functions of this module process all the frames of a record (or of a
+range of frames) at once, using numpy array operations, instead of one frame
+(and one point) at a time. They are used by visualise_dataset.py to
+precompute the geometry of the scene before playback, and can be used as
+they are by batch analysis tools.
+
+License: CC-0
+"""
+
+import numpy as np
+
+import transformations
+
+
+def transform_points(points, transform):
+    """ Applies the 4x4 homogeneous 'transform' to an array of 3D points, of
+    any shape (..., 3).
+
+    :returns: the transformed points, with the same shape as 'points'
+    """
+    points = np.asarray(points)
+    rotation = transform[:3, :3].astype(points.dtype)
+    translation = transform[:3, 3].astype(points.dtype)
+
+    # one single matrix product for all the points
+    return points @ rotation.T + translation
+
+
+def landmarks_to_table(keypoints, cam_to_centre, image_width, image_height, z_image_plane):
+    """ Transforms the 2D facial landmarks (or skeleton keypoints) of a whole
+    record into 3D points in the table reference frame.
+
+    The normalised 2D coordinates are first placed on a virtual image plane,
+    of size image_width x image_height (in m), at a distance z_image_plane
+    from the camera; the points are then transformed from the camera frame
+    into the table frame.
+
+    :param keypoints: (frames, points, 2) array of normalised coordinates (cf
+                      FrameStore.keypoints)
+    :param cam_to_centre: 4x4 transformation from the camera frame to the
+                          table centre frame
+
+    :returns: a (frames, points, 3) array of 32-bit floats
+    """
+    keypoints = np.asarray(keypoints)
+
+    points = np.empty(keypoints.shape[:-1] + (3,), dtype=np.float32)
+    points[..., 0] = image_width * keypoints[..., 0] - image_width / 2
+    points[..., 1] = image_height * keypoints[..., 1] - image_height / 2
+    points[..., 2] = z_image_plane
+
+    return transform_points(points, cam_to_centre)
+
+
+def align_faces(keypoints, template=None, scaling=True, image_size=None):
+    """ Removes the motion of the head from the 2D facial landmarks of a
+    whole record (eg, before analysing the facial expressions): the
+    landmarks of each frame are aligned on a reference face, with the
+    rotation (in the image plane), translation and, if 'scaling', uniform
+    scale that best superimpose them (cf
+    transformations.superimposition_matrices: one SVD per frame, all
+    computed at once).
+
+    :param keypoints: (frames, points, 2) array of normalised coordinates (cf
+                      FrameStore.keypoints)
+    :param template: (optional) (points, 2) landmarks of the reference face,
+                     in the same units as the aligned landmarks (see
+                     'image_size'); by default, the mean face of the record
+    :param scaling: whether the faces are also rescaled to the size of the
+                    reference face
+    :param image_size: (width, height) the normalised coordinates are
+                       multiplied by, so that the landmarks are aligned in an
+                       isotropic frame. By default, the size of the images of
+                       the dataset, (scene.IMAGE_WIDTH, scene.IMAGE_HEIGHT).
+
+    :returns: (landmarks, transforms): the (frames, points, 2) array of 32-bit
+              floats of the aligned landmarks, and the (frames, 4, 4) array of
+              the transformations applied to each frame. Both are NaN for the
+              frames with missing landmarks.
+    """
+    if image_size is None:
+        # scene imports geometry: imported here to avoid a circular import
+        import scene
+        image_size = (scene.IMAGE_WIDTH, scene.IMAGE_HEIGHT)
+
+    keypoints = np.asarray(keypoints, dtype=np.float64) * image_size
+    valid = np.isfinite(keypoints).all(axis=(-2, -1))
+
+    def vector_set(points):
+        # (..., points, 2) landmarks -> (..., 3, points) points of the z=0 plane
+        points = np.swapaxes(points, -1, -2)
+        return np.concatenate([points, np.zeros_like(points[..., :1, :])], axis=-2)
+
+    transforms = np.full(keypoints.shape[:-2] + (4, 4), np.nan)
+
+    # if no frame has all its landmarks, there is no face to align (nor to
+    # compute the mean face from)
+    if valid.any():
+        if template is None:
+            faces = keypoints[valid]
+            template = (faces - faces.mean(axis=-2, keepdims=True)).mean(axis=0)
+
+        transforms[valid] = transformations.superimposition_matrices(vector_set(keypoints[valid]),
+                                                                     vector_set(np.asarray(template, dtype=np.float64)),
+                                                                     scaling=scaling)
+
+    # the NaN transformations of the frames with missing landmarks simply
+    # propagate to their aligned landmarks
+    with np.errstate(invalid='ignore'):
+        landmarks = np.matmul(keypoints, np.swapaxes(transforms[..., :2, :2], -1, -2)) + transforms[..., np.newaxis, :2, 3]
+
+    return landmarks.astype(np.float32), transforms
+
+
+def euler_rotations(angles):
+    """ Returns the rotation matrices corresponding to an array of Euler
+    angles, in the 'sxyz' convention (the one of
+    transformations.euler_matrix's and compose_matrix's defaults).
+
+    :param angles: (..., 3) array of (rx, ry, rz) angles, in radians
+    :returns: a (..., 3, 3) array of rotation matrices
+    """
+    angles = np.asarray(angles, dtype=np.float64)
+
+    return transformations.euler_matrices(angles[..., 0], angles[..., 1], angles[..., 2])[..., :3, :3]
+
+
+def head_poses(positions, angles):
+    """ Returns the 4x4 head pose matrices of a whole record, ie, for each
+    frame, transformations.compose_matrix(angles=<angles>, translate=<position>).
+
+    :param positions: (frames, 3) array of head positions
+    :param angles: (frames, 3) array of head orientations (Euler angles, 'sxyz')
+    :returns: a (frames, 4, 4) array
+    """
+    return transformations.compose_matrices(angles=angles, translate=positions)
+
+
+def transform_head_poses(positions, angles, transform):
+    """ Re-expresses the head poses of a whole record in another reference
+    frame (eg, from the table frame of the dataset to the frame of one of the
+    cameras, with the inverse of scene.CAM_TO_CENTRE[child]).
+
+    :param positions: (frames, 3) array of head positions
+    :param angles: (frames, 3) array of head orientations (Euler angles, 'sxyz')
+    :param transform: 4x4 transformation from the current frame of the poses
+                      to the new one
+    :returns: (positions, angles), the head poses in the new frame
+    """
+    poses = np.matmul(transform, head_poses(positions, angles))
+
+    _, _, angles, positions, _ = transformations.decompose_matrices(poses)
+
+    return positions, angles
+
+
+def resample_head_poses(timestamps, positions, angles, times, max_gap=None):
+    """ Resamples the head poses of a whole record at arbitrary times (eg,
+    the timestamps of another clock, like the /tf messages of the bag files
+    or the annotations), or fills the frames where the head pose is missing.
+
+    The positions are linearly interpolated; the orientations are
+    interpolated along the shortest arc (cf transformations.quaternion_slerps).
+    The frames whose pose is missing (NaN) are ignored.
+
+    :param timestamps: (frames,) sorted array of the timestamps of the poses
+    :param positions: (frames, 3) array of head positions
+    :param angles: (frames, 3) array of head orientations (Euler angles, 'sxyz')
+    :param times: (n,) array of the times to resample the poses at
+    :param max_gap: (optional) maximum duration (in s) of the gaps between
+                    two valid poses that are interpolated over
+
+    :returns: (positions, angles), the (n, 3) arrays of the resampled head
+              poses; NaN outside of the record, or in gaps longer than
+              'max_gap'
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    angles = np.asarray(angles, dtype=np.float64)
+    times = np.asarray(times, dtype=np.float64)
+
+    valid = np.isfinite(positions).all(axis=-1) & np.isfinite(angles).all(axis=-1)
+    timestamps = np.asarray(timestamps, dtype=np.float64)[valid]
+    positions = positions[valid]
+    angles = angles[valid]
+
+    if len(timestamps) < 2:
+        return np.full(times.shape + (3,), np.nan), np.full(times.shape + (3,), np.nan)
+
+    quaternions = transformations.quaternions_from_euler(angles[:, 0], angles[:, 1], angles[:, 2])
+
+    # for each time, the poses before and after it
+    before = np.clip(np.searchsorted(timestamps, times, side='right') - 1, 0, len(timestamps) - 2)
+    after = before + 1
+
+    duration = timestamps[after] - timestamps[before]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction = np.where(duration > 0, (times - timestamps[before]) / duration, 0.)
+    fraction = np.clip(fraction, 0., 1.)
+
+    missing = (times < timestamps[0]) | (times > timestamps[-1])
+    if max_gap is not None:
+        missing |= (duration > max_gap) & (fraction > 0.) & (fraction < 1.)
+
+    resampled_positions = positions[before] + (positions[after] - positions[before]) * fraction[:, np.newaxis]
+
+    resampled = transformations.quaternion_slerps(quaternions[before], quaternions[after], fraction)
+    resampled_angles = np.stack(transformations.euler_from_matrices(transformations.quaternion_matrices(resampled)), axis=-1)
+
+    resampled_positions[missing] = np.nan
+    resampled_angles[missing] = np.nan
+
+    return resampled_positions, resampled_angles
+
+
+# end points of the 3 segments (x, y and z axes) of a reference gizmo of
+# size 1
+GIZMO = np.array([[0, 0, 0], [1, 0, 0],
+                  [0, 0, 0], [0, 1, 0],
+                  [0, 0, 0], [0, 0, 1]], dtype=np.float64)
+
+
+def head_gizmos(positions, angles, size=0.1):
+    """ Computes the reference gizmos (3 segments along the x, y and z axes
+    of the head frame) representing the head poses of a whole record.
+
+    :param positions: (frames, 3) array of head positions
+    :param angles: (frames, 3) array of head orientations (Euler angles, 'sxyz')
+    :param size: length of the gizmo's segments, in m
+
+    :returns: a (frames, 6, 3) array of 32-bit floats: the end points of the
+              x, y and z segments, in the frame of the head positions
+    """
+    rotations = euler_rotations(angles)
+    positions = np.asarray(positions, dtype=np.float64)
+
+    # (frames, 6, 3): the points of the gizmo rotated, then translated, for
+    # every frame at once
+    points = size * GIZMO @ np.swapaxes(rotations, -1, -2) + positions[..., np.newaxis, :]
+
+    return points.astype(np.float32)
+
+
+def project_on_plane(origins, directions, plane=None):
+    """ Computes the intersections of rays with the XY plane of the reference
+    frame 'plane', for any number of rays at once.
+
+    :param origins: (..., 3) array of the origins of the rays
+    :param directions: (..., 3) array of the directions of the rays
+    :param plane: 4x4 pose of the plane, expressed in the same reference frame
+                  as the rays (by default, the identity: the XY plane of the
+                  rays' own frame, ie the table surface for the gaze vectors
+                  of the dataset)
+
+    :returns: a (..., 3) array of the intersections, expressed in the 'plane'
+              reference frame (the z coordinates are therefore 0), and NaN
+              where the ray is parallel to the plane or points away from it.
+    """
+    origins = np.asarray(origins, dtype=np.float64)
+    directions = np.asarray(directions, dtype=np.float64)
+
+    if plane is not None:
+        # express the rays in the plane's frame
+        inverse = np.linalg.inv(plane)
+        origins = transform_points(origins, inverse)
+        directions = directions @ inverse[:3, :3].T
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = -origins[..., 2] / directions[..., 2]
+        # t is infinite (or NaN) for the rays parallel to the plane
+        t = np.where(np.isfinite(t) & (t >= 0), t, np.nan)
+
+        return origins + t[..., np.newaxis] * directions
@@ -0,0 +1,345 @@
+"""
+Loading of the PInSoRo ``pinsoro-*.csv`` files.
+
+Parsing the 449 columns of a record with pandas takes tens of seconds. To avoid
+doing it again and again, the first time a record is loaded, the CSV file is
+converted into a binary, columnar cache (one numpy array per column, stored in
+a ``.npz`` archive). Subsequent loads only read back the binary arrays.
+
+The cache is keyed on the MD5 checksum of the CSV file (as stored in the
+``pinsoro-*.csv.md5`` files, cf ``compute_md5sums``): if the checksum changes,
+the cache is transparently rebuilt.
+
+Columns are loaded with the types defined in ``schema.py`` (32-bit floats and
+categoricals), which considerably reduces the memory footprint of a record.
+When only some families of fields are needed (for instance, the head poses),
+they can be selected with the 'groups' parameter: only the corresponding
+columns are then read from disk.
+
+For passes over the whole corpus, 'iterchunks' streams a record by chunks of
+frames, with a constant memory footprint whatever the length of the record.
+
+The annotation fields can be decoded into arrays of integer codes (the
+indices of the labels in the vocabularies of timeline.py) with
+'decode_annotations'.
+
+Typical usage:
+
+    import pinsoro
+    data = pinsoro.load("<path to record>/pinsoro-<id>.csv")
+    heads = pinsoro.load("<path to record>/pinsoro-<id>.csv", groups=["head"], child="purple")
+
+License: CC-0
+"""
+
+import logging
+import os
+import os.path
+import glob
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+import schema
+from timeline import CONSTRUCTS_NAMES
+
+# name of the directory (created next to the CSV files) where the cached
+# records are stored
+CACHE_DIRNAME = ".pinsoro-cache"
+
+# version of the cache format. Bump it whenever the content of the caches
+# changes, so that existing caches get rebuilt.
+CACHE_VERSION = 3
+
+# special members of the cache archives
+COLUMNS_KEY = "__columns__"
+CATEGORICAL_KEY = "__categorical__"
+CATEGORIES_SUFFIX = ".categories"
+
+# default number of frames returned by iterchunks (1 min of data at 30Hz)
+CHUNKSIZE = 1800
+
+# separator used in the annotation fields when the annotators disagree
+SEPARATOR = "+"
+
+
+def checksum(path):
+    """ Returns the MD5 checksum of the CSV file 'path'.
+
+    The checksum is read from the 'path.md5' file if it exists (as created by
+    compute_md5sums). Otherwise, it is computed from the file content.
+    """
+    md5file = path + ".md5"
+
+    if os.path.exists(md5file):
+        with open(md5file, 'r') as f:
+            return f.read().split()[0]
+
+    logging.info("No checksum file for %s. Computing the MD5 checksum (run compute_md5sums to avoid it)..." % path)
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def cache_path(path, cachedir=None, md5=None, suffix=".npz"):
+    """ Returns the path of the cache of the CSV file 'path'.
+
+    :param cachedir: the directory where the cache is stored. By default,
+                     a CACHE_DIRNAME directory next to the CSV file.
+    :param md5: the MD5 checksum of the CSV file. Computed if not provided.
+    :param suffix: the extension of the cache file. Other caches derived from
+                   the same record (like the frame store, cf framestore.py)
+                   share the same checksum-based prefix, with another suffix.
+    """
+    if cachedir is None:
+        cachedir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIRNAME)
+
+    if md5 is None:
+        md5 = checksum(path)
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cachedir, "%s.%s.v%d%s" % (name, md5, CACHE_VERSION, suffix))
+
+
+def remove_stale_caches(cachefile):
+    """ Removes the caches of the same record as 'cachefile' that have been
+    built from a different version of the CSV file (ie, with a different
+    checksum), or with a different version of the cache format.
+    """
+    cachedir, basename = os.path.split(cachefile)
+    name, md5, version = basename.split(".")[:3]
+    current = "%s.%s.%s." % (name, md5, version)
+
+    for stale in glob.glob(os.path.join(cachedir, glob.escape(name) + ".*")):
+        if not os.path.basename(stale).startswith(current) and ".tmp." not in stale:
+            logging.info("Removing stale cache %s" % stale)
+            os.remove(stale)
+
+
+def tmp_path(cachefile):
+    """ Returns a temporary file name to write 'cachefile' to, before moving
+    it in place with os.replace: that way, an interrupted build never leaves a
+    truncated cache behind.
+
+    The extension of 'cachefile' is kept, as numpy appends one otherwise.
+    """
+    root, ext = os.path.splitext(cachefile)
+    return "%s.%d.tmp%s" % (root, os.getpid(), ext)
+
+
+def read_csv(path, **kwargs):
+    """ Parses the CSV file 'path', using the types defined in schema.py.
+
+    Additional keyword arguments are passed to pandas.read_csv.
+    """
+    return pd.read_csv(path, dtype=schema.DTYPES, **kwargs)
+
+
+def build_cache(path, cachefile):
+    """ Parses the CSV file 'path' and stores its content into 'cachefile'.
+
+    Numerical columns are stored with their schema types. Categorical columns
+    are stored as integer codes (-1 for missing values) + list of categories.
+
+    Stale caches of the same record (ie, with a different checksum) are
+    removed.
+    """
+
+    logging.info("Building the cache of %s (this is only done once)..." % path)
+    data = read_csv(path)
+
+    arrays = {}
+    categorical = []
+
+    for col in data.columns:
+        values = data[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            arrays[col] = values.cat.codes.values
+            arrays[col + CATEGORIES_SUFFIX] = np.asarray(values.cat.categories, dtype=str)
+            categorical.append(col)
+        elif pd.api.types.is_numeric_dtype(values.dtype):
+            arrays[col] = values.values
+        else:
+            # unexpected, non-numerical column (not part of the schema)
+            codes, categories = pd.factorize(values)
+            arrays[col] = codes.astype(np.int32)
+            arrays[col + CATEGORIES_SUFFIX] = np.asarray(categories, dtype=str)
+            categorical.append(col)
+
+    arrays[COLUMNS_KEY] = np.asarray(data.columns, dtype=str)
+    arrays[CATEGORICAL_KEY] = np.asarray(categorical, dtype=str)
+
+    cachedir = os.path.dirname(cachefile)
+    if not os.path.isdir(cachedir):
+        os.makedirs(cachedir)
+
+    tmpfile = tmp_path(cachefile)
+    np.savez(tmpfile, **arrays)
+    os.replace(tmpfile, cachefile)
+
+    remove_stale_caches(cachefile)
+
+    logging.debug("%s successfully saved." % cachefile)
+
+
+def read_cache(cachefile, columns=None):
+    """ Reads back a cache created by build_cache as a pandas DataFrame, with
+    the same content as the one returned by read_csv on the original file.
+
+    :param columns: if not None, only these columns are read from the cache.
+    """
+
+    with np.load(cachefile) as npz:
+        # the arrays stored in the .npz archive are only read when accessed
+        if columns is None:
+            columns = list(npz[COLUMNS_KEY])
+        categorical = set(npz[CATEGORICAL_KEY])
+
+        data = {}
+        for col in columns:
+            if col in categorical:
+                data[col] = pd.Categorical.from_codes(npz[col], npz[col + CATEGORIES_SUFFIX])
+            else:
+                data[col] = npz[col]
+
+    return pd.DataFrame(data, columns=columns)
+
+
+def load(path, groups=None, child=None, use_cache=True, cachedir=None):
+    """ Loads a pinsoro-*.csv file as a pandas DataFrame, with the column types
+    defined in schema.py.
+
+    :param path: path to the CSV file
+    :param groups: if not None, only load the given families of fields (cf
+                   schema.GROUPS; eg ["head", "gaze"]). The timestamp is
+                   always included.
+    :param child: in combination with 'groups', 'purple' or 'yellow' to only
+                  load the fields of one of the children.
+    :param use_cache: if False, always parse the CSV file
+    :param cachedir: where to store the cache (cf cache_path)
+    """
+
+    columns = None
+    if groups is not None:
+        columns = schema.fields(groups, child)
+
+    if not use_cache:
+        return read_csv(path, usecols=columns)
+
+    cachefile = cache_path(path, cachedir)
+
+    if not os.path.exists(cachefile):
+        build_cache(path, cachefile)
+
+    return read_cache(cachefile, columns)
+
+
+def chunk_columns(groups=None, child=None):
+    """ Returns the list of columns of the chunks returned by iterchunks, for
+    the given 'groups' and 'child' (cf load).
+
+    Only numerical fields are returned (the timestamps are returned
+    separately; 'complete' is converted to 0. or 1.). The string fields
+    (condition, annotations...) are not part of the chunks.
+    """
+    if groups is None:
+        fields = schema.FIELDNAMES
+    else:
+        fields = schema.fields(groups, child)
+
+    return [f for f in fields if f != "timestamp" and f not in schema.CATEGORICAL_FIELDS]
+
+
+def iterchunks(path, chunksize=CHUNKSIZE, groups=None, child=None, use_cache=True, cachedir=None):
+    """ Iterates over the frames of a pinsoro-*.csv file, by chunks of
+    (at most) 'chunksize' frames.
+
+    Only one chunk is held in memory at a time. If use_cache is True, the
+    chunks are read from the memory-mapped frame store of the record (cf
+    framestore.py), which is created if needed (this first time, the whole
+    record is loaded). Otherwise, the CSV file is directly parsed, chunk by
+    chunk.
+
+    :param groups: if not None, only return the given families of fields
+                   (cf load)
+    :param child: in combination with 'groups', 'purple' or 'yellow' to only
+                  return the fields of one of the children.
+
+    :returns: a generator of (timestamps, frames) tuples: 'timestamps' is a
+              (n,) array of 64-bit floats, and 'frames' a (n, k) array of
+              32-bit floats, with the k columns returned by chunk_columns.
+    """
+
+    columns = chunk_columns(groups, child)
+
+    if not use_cache:
+        for chunk in read_csv(path, usecols=["timestamp"] + columns, chunksize=chunksize):
+            yield chunk["timestamp"].values, chunk[columns].values.astype(np.float32)
+        return
+
+    from framestore import FrameStore
+    store = FrameStore(path, cachedir=cachedir)
+    indices = [store.index[c] for c in columns]
+
+    for start in range(0, len(store), chunksize):
+        stop = start + chunksize
+        # fancy indexing copies the selected columns out of the memory-mapped
+        # store: only this chunk ends up in memory
+        yield np.array(store.timestamps[start:stop]), store.frames[start:stop, indices]
+
+
+def vocabulary(field):
+    """ Returns the vocabulary of the annotation field 'field' (eg,
+    timeline.TASKENGAGEMENT for 'purple_child_task_engagement').
+    """
+    construct = field.split("_child_", 1)[1]
+    for vocab, name in CONSTRUCTS_NAMES.items():
+        if name == construct:
+            return vocab
+    raise ValueError("%s is not an annotation field" % field)
+
+
+def decode_annotations(codes, categories, vocab):
+    """ Decodes the values of an annotation field into integer codes.
+
+    When several annotators annotated a frame and disagreed, the CSV files
+    store the set of their (different) annotations, separated by '+'. Each
+    of these labels is decoded into its index in 'vocab', and the labels of
+    a frame are sorted by increasing index.
+
+    Only the distinct categories of the field are parsed: the frames are then
+    decoded with a single vectorised lookup.
+
+    :param codes: integer codes of the values of the field, -1 for missing
+                  values (for instance, data[field].cat.codes with a DataFrame
+                  returned by load, or store.column(field) with a FrameStore)
+    :param categories: the strings corresponding to each code
+    :param vocab: the vocabulary of the construct (cf vocabulary)
+
+    :returns: (labels, disagreement): 'labels' is a (frames, n) int8 array,
+              with n the largest number of different labels given to a
+              frame, padded with -1 (-1 everywhere if the frame is not
+              annotated); 'disagreement' is a boolean array, True for the
+              frames whose annotators disagreed.
+    """
+
+    decoded = [sorted(vocab.index(label) for label in str(c).split(SEPARATOR)) for c in categories]
+    width = max([len(d) for d in decoded] + [1])
+
+    # one row per category, + a last row of -1, indexed by the code -1 of
+    # missing values
+    table = np.full((len(decoded) + 1, width), -1, dtype=np.int8)
+    for i, d in enumerate(decoded):
+        table[i, :len(d)] = d
+
+    labels = table[np.asarray(codes).astype(np.intp)]
+
+    if width > 1:
+        disagreement = labels[:, 1] >= 0
+    else:
+        disagreement = np.zeros(len(labels), dtype=bool)
+
+    return labels, disagreement
@@ -0,0 +1,208 @@
+"""
+Per-frame timing of the rendering stages of the dataset player.
+
+A StageTimer measures how long each stage of the rendering of a frame takes
+(eg, reading the data, computing the geometry, updating the matplotlib
+artists, drawing the canvas), and summarises the timings of all the frames
+once the playback is over:
+
+    timer = StageTimer()
+
+    for frame in frames:
+        timer.new_frame()
+        with timer("data"):
+            ...
+        with timer("draw"):
+            ...
+
+    print(timer.summary())
+    print(timer.histograms())
+    timer.save("timings.csv")
+
+A stage can be timed several times per frame: the durations are summed. The
+time between two calls to new_frame() is recorded as the 'frame' stage; the
+summary also reports the time spent outside of the timed stages as 'other'.
+
+License: CC-0
+"""
+
+import time
+import contextlib
+
+import numpy as np
+
+FRAME = "frame"
+OTHER = "other"
+
+PERCENTILES = [50, 95, 99]
+
+
+class StageTimer:
+    """ Collects the durations of the rendering stages of each frame.
+    """
+
+    def __init__(self):
+
+        # {stage: list of the durations (in s) of the stage, one per frame}
+        self.timings = {FRAME: []}
+
+        # durations of the stages of the current frame
+        self._current = {}
+        self._framestart = None
+
+    def new_frame(self):
+        """ Starts timing a new frame (and stores the timings of the previous
+        one).
+        """
+        now = time.perf_counter()
+
+        if self._framestart is not None:
+            self._commit(now - self._framestart)
+
+        self._framestart = now
+
+    def finish(self):
+        """ Stores the timings of the last frame. To be called once the
+        playback is over.
+        """
+        if self._framestart is not None:
+            self._commit(time.perf_counter() - self._framestart)
+            self._framestart = None
+
+    def _commit(self, duration):
+
+        nb_frames = len(self.timings[FRAME])
+
+        for stage, value in self._current.items():
+            # stages that appear in the middle of the playback are 0 for the
+            # previous frames
+            self.timings.setdefault(stage, [0.] * nb_frames).append(value)
+
+        for stage, values in self.timings.items():
+            if stage != FRAME and stage not in self._current:
+                values.append(0.)
+
+        self.timings[FRAME].append(duration)
+        self._current = {}
+
+    @contextlib.contextmanager
+    def __call__(self, stage):
+        """ Context manager timing the enclosed code as part of 'stage'.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # only the time spent during the current frame is counted (for
+            # instance, the first frame might be rendered while the figure is
+            # being drawn for the first time)
+            if self._framestart is not None:
+                start = max(start, self._framestart)
+                self._current[stage] = self._current.get(stage, 0.) + time.perf_counter() - start
+
+    def wrap(self, stage, func):
+        """ Returns a version of 'func' whose calls are timed as part of
+        'stage'.
+        """
+        def timed(*args, **kwargs):
+            with self(stage):
+                return func(*args, **kwargs)
+        return timed
+
+    def merge(self, timings):
+        """ Adds the timings collected by another timer (eg, in another
+        process), as returned by its 'timings' attribute.
+        """
+        nb_frames = len(self.timings[FRAME])
+        nb_new = len(timings[FRAME])
+
+        for stage in list(self.timings) + [s for s in timings if s not in self.timings]:
+            self.timings.setdefault(stage, [0.] * nb_frames).extend(timings.get(stage, [0.] * nb_new))
+
+    def __len__(self):
+        return len(self.timings[FRAME])
+
+    def histogram(self, stage, bins=50):
+        """ Returns the histogram (counts, bin edges in s) of the durations of
+        'stage', with logarithmic bins.
+        """
+        values = np.asarray(self.timings[stage])
+        values = values[values > 0]
+        if len(values) == 0:
+            return np.zeros(bins, dtype=int), np.zeros(bins + 1)
+
+        edges = np.geomspace(values.min(), values.max() * (1 + 1e-9), bins + 1)
+        return np.histogram(values, edges)
+
+    def histograms(self, bins=10, width=40):
+        """ Returns the histograms of the durations of each stage (cf
+        'histogram'), as text: one line per bin, with the range of the bin in
+        milliseconds, the number of frames and a bar of at most 'width'
+        characters.
+        """
+        if len(self) == 0:
+            return "No frame rendered."
+
+        lines = []
+        for stage in self.timings:
+            counts, edges = self.histogram(stage, bins)
+            if counts.sum() == 0:
+                continue
+
+            lines.append("%s:" % stage)
+            for count, low, high in zip(counts, edges[:-1] * 1000., edges[1:] * 1000.):
+                bar = "#" * int(round(width * count / counts.max()))
+                lines.append(("  %8.2f - %8.2fms %6d %s" % (low, high, count, bar)).rstrip())
+
+        return "\n".join(lines)
+
+    def summary(self):
+        """ Returns a table of the mean and percentiles (cf PERCENTILES) of
+        the duration of each stage, in milliseconds, and of the share of the
+        total frame time spent in each stage.
+        """
+        if len(self) == 0:
+            return "No frame rendered."
+
+        total = sum(self.timings[FRAME])
+
+        lines = ["%d frames, %.1fs (%.1f frames/s)" % (len(self), total, len(self) / total if total else 0.),
+                 "%-10s %9s " % ("stage", "mean") + " ".join("%9s" % ("p%d" % p) for p in PERCENTILES) + " %9s %7s" % ("max", "share")]
+
+        stages = [s for s in self.timings if s != FRAME]
+
+        # time spent outside of the timed stages (event loop, waiting for the
+        # next frame, video encoding...)
+        frames = np.asarray(self.timings[FRAME])
+        other = np.maximum(0., frames - sum(np.asarray(self.timings[s]) for s in stages))
+
+        for stage, values in [(s, self.timings[s]) for s in stages] + [(OTHER, other), (FRAME, frames)]:
+            values = np.asarray(values) * 1000.
+            lines.append("%-10s %7.2fms " % (stage, values.mean()) +
+                         " ".join("%7.2fms" % v for v in np.percentile(values, PERCENTILES)) +
+                         " %7.2fms %6.1f%%" % (values.max(), 100. * values.sum() / 1000. / total if total else 0.))
+
+        return "\n".join(lines)
+
+    def save(self, path):
+        """ Saves the timings (in seconds) as a CSV file, with one row per
+        frame and one column per stage.
+        """
+        stages = list(self.timings)
+        np.savetxt(path, np.column_stack([self.timings[s] for s in stages]),
+                   delimiter=",", header=",".join(stages), comments="", fmt="%.6f")
+
+
+class NullTimer(StageTimer):
+    """ A StageTimer that does not time anything (used when profiling is
+    disabled).
+    """
+
+    def new_frame(self):
+        pass
+
+    def __call__(self, stage):
+        return contextlib.nullcontext()
+
+    def wrap(self, stage, func):
+        return func
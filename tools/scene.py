@@ -0,0 +1,158 @@
+"""
+Static geometry of the PInSoRo experimental setup.
+
+All the 3D data of the dataset is expressed in the reference frame of the
+centre of the interactive table (sandtray). A Scene holds the static objects
+of the setup in this frame: the extrinsics of the two children-facing
+cameras (cf tfgraph.py), the outline of the table, the axes of the reference
+frame, the frustums of the cameras and the 'image planes' where the 2D facial
+landmarks are displayed.
+
+The geometry is computed once (each object is transformed with a single
+matrix product, cf geometry.transform_points), and shared by all the
+renderers (visualise_dataset.py, topdown.py) and batch tools. DEFAULT_SCENE
+is the scene with the extrinsics of the dataset; the extrinsics of a given
+record can be overridden with Scene.with_extrinsics, which only recomputes
+the objects attached to the overridden cameras:
+
+    from scene import DEFAULT_SCENE
+
+    scene = DEFAULT_SCENE.with_extrinsics(purple=<4x4 camera to table centre transform>)
+    faces = scene.landmarks_to_table(store.keypoints("purple", "face"), "purple")
+
+License: CC-0
+"""
+
+import numpy as np
+
+import geometry
+import tfgraph
+from schema import CHILDREN
+
+# dimensions of the interactive table (sandtray), centred on the origin of the
+# common reference frame, its length along the x axis
+SANDTRAY_WIDTH = 0.338 #m
+SANDTRAY_LENGTH = 0.600 #m
+
+IMAGE_WIDTH = 0.960 # the orginial images' resolution, in px/1000
+IMAGE_HEIGHT = 0.540
+
+# distance from the camera of the 'image plane' where the 2D facial landmarks
+# are plotted
+Z_IMAGE_PLANE = 1. #m
+
+# length of the axes of the reference frame, as drawn in the scene
+AXES_LENGTH = 0.100 #m
+
+
+# numpy.dot({PURPLE,YELLOW}_CAM_TO_CENTRE, <vector>) transforms
+# a vector <vector> from one of the camera's frame to the centre of the sandtray table frame.
+CAM_TO_CENTRE = {child: tfgraph.DEFAULT_GRAPH.lookup(tfgraph.SANDTRAY_CENTRE, tfgraph.camera_frame(child))
+                 for child in CHILDREN}
+YELLOW_CAM_TO_CENTRE = CAM_TO_CENTRE["yellow"]
+PURPLE_CAM_TO_CENTRE = CAM_TO_CENTRE["purple"]
+
+
+def _camera_frustum(width=0.05):
+    """ Returns the polyline (11 x 3 array) representing a camera of the given
+    width (m), in the camera frame.
+    """
+    cw = width
+    ch = cw * IMAGE_HEIGHT / IMAGE_WIDTH # height of the camera, keeping the image's aspect ratio
+    cz = Z_IMAGE_PLANE / IMAGE_WIDTH * (cw * 2)
+    return np.array([[0, cw, -cw, 0, cw, -cw, 0, cw, cw, -cw, -cw],
+                     [0, ch, ch, 0, -ch, -ch, 0, -ch, ch, ch, -ch],
+                     [0, cz, cz, 0, cz, cz, 0, cz, cz, cz, cz]]).T
+
+# the objects attached to the cameras, in the camera frame
+CAMERA_FRUSTUM = _camera_frustum()
+
+IMAGE_PLANE = np.array([[-IMAGE_WIDTH/2, IMAGE_WIDTH/2, IMAGE_WIDTH/2, -IMAGE_WIDTH/2, -IMAGE_WIDTH/2],
+                        [-IMAGE_HEIGHT/2, -IMAGE_HEIGHT/2, IMAGE_HEIGHT/2, IMAGE_HEIGHT/2, -IMAGE_HEIGHT/2],
+                        [Z_IMAGE_PLANE] * 5]).T
+
+# the objects attached to the table, in the table frame
+TABLE_OUTLINE = np.array([[-SANDTRAY_LENGTH/2, -SANDTRAY_LENGTH/2, SANDTRAY_LENGTH/2, SANDTRAY_LENGTH/2, -SANDTRAY_LENGTH/2],
+                          [-SANDTRAY_WIDTH/2, SANDTRAY_WIDTH/2, SANDTRAY_WIDTH/2, -SANDTRAY_WIDTH/2, -SANDTRAY_WIDTH/2],
+                          [0] * 5]).T
+
+# x, y and z axes, as 3 segments (2 x 3 arrays)
+AXES = [np.array([np.zeros(3), AXES_LENGTH * axis]) for axis in np.identity(3)]
+
+
+class Scene:
+    """ Static objects of the setup, in the table centre reference frame.
+
+    :param cam_to_centre: (optional) dictionary {child: 4x4 matrix} of the
+                          transformations from the children-facing cameras
+                          to the table centre; by default, CAM_TO_CENTRE.
+
+    Attributes:
+     - cam_to_centre: {child: 4x4 transformation}
+     - table: (5, 3) polyline of the table outline
+     - axes: list of the x, y, z axes of the reference frame, as (2, 3) segments
+     - cameras: {child: (11, 3) polyline of the camera}
+     - image_planes: {child: (5, 3) polyline of the camera's image plane}
+    """
+
+    def __init__(self, cam_to_centre=None):
+
+        self.cam_to_centre = dict(CAM_TO_CENTRE)
+        self.cam_to_centre.update(cam_to_centre or {})
+
+        self.table = TABLE_OUTLINE
+        self.axes = AXES
+
+        self.cameras = {}
+        self.image_planes = {}
+        for child in CHILDREN:
+            self._place_camera(child)
+
+        # scenes with overridden extrinsics, cf with_extrinsics
+        self._variants = {}
+
+    def _place_camera(self, child):
+
+        self.cameras[child] = geometry.transform_points(CAMERA_FRUSTUM, self.cam_to_centre[child])
+        self.image_planes[child] = geometry.transform_points(IMAGE_PLANE, self.cam_to_centre[child])
+
+    def with_extrinsics(self, **cam_to_centre):
+        """ Returns the scene with the extrinsics of some of the cameras
+        replaced, eg scene.with_extrinsics(purple=<4x4 matrix>).
+
+        Only the objects attached to the overridden cameras are computed; the
+        others are shared with this scene. The resulting scenes are cached:
+        asking twice for the same extrinsics returns the same scene.
+        """
+        key = tuple(sorted((child, np.asarray(m, dtype=np.float64).tobytes()) for child, m in cam_to_centre.items()))
+
+        if key not in self._variants:
+            scene = Scene.__new__(Scene)
+            scene.cam_to_centre = dict(self.cam_to_centre)
+            scene.table = self.table
+            scene.axes = self.axes
+            scene.cameras = dict(self.cameras)
+            scene.image_planes = dict(self.image_planes)
+            scene._variants = {}
+
+            for child, m in cam_to_centre.items():
+                scene.cam_to_centre[child] = np.asarray(m, dtype=np.float64)
+                scene._place_camera(child)
+
+            self._variants[key] = scene
+
+        return self._variants[key]
+
+    def landmarks_to_table(self, keypoints, child):
+        """ Transforms the normalised 2D keypoints (facial landmarks or
+        skeleton) of 'child', for any number of frames (cf
+        FrameStore.keypoints), into 3D points on the image plane of the
+        child's camera, in the table frame.
+
+        :returns: a (frames, points, 3) array of 32-bit floats
+        """
+        return geometry.landmarks_to_table(keypoints, self.cam_to_centre[child],
+                                           IMAGE_WIDTH, IMAGE_HEIGHT, Z_IMAGE_PLANE)
+
+
+DEFAULT_SCENE = Scene()
@@ -0,0 +1,157 @@
+"""
+Schema of the PInSoRo ``pinsoro-*.csv`` files.
+
+This module lists the 449 fields of the CSV files, following the description
+given in ``data/README.md`` (section 'Format of the CSV files'), and the
+type each of them should be loaded with:
+
+- the timestamps are kept as 64-bit floats (UNIX timestamps do not fit in a
+  32-bit float without losing sub-second precision);
+- all the other numerical fields (ages, frame indices, normalised facial
+  landmarks and skeletons, head pose, gaze, action units, motion, audio) are
+  loaded as 32-bit floats;
+- the string fields (recording id, condition, annotators, genders and the six
+  annotations) have only a few distinct values per record: they are loaded
+  as pandas categoricals.
+
+The fields are also organised in families (face, skeleton, head, gaze,
+action units, motion, annotations...; cf GROUPS), that can be selected
+independently for each child (cf 'fields').
+
+License: CC-0
+"""
+
+import numpy as np
+
+CHILDREN = ["purple", "yellow"]
+
+AUS = [1, 2, 4, 5, 6, 7, 9, 10, 12, 14, 15, 17, 20, 23, 25, 26, 28, 45]
+
+NUM_FACIAL_LANDMARKS = 70
+NUM_SKELETON_KEYPOINTS = 18
+NUM_AUDIO_FEATURES = 16
+
+CONSTRUCTS = ["task_engagement", "social_engagement", "social_attitude"]
+
+
+# families of per-child fields, in the order they appear in the CSV files
+CHILD_GROUPS = ["frame_idx", "face", "skeleton", "head", "gaze", "aus", "motion"]
+
+# all the families of fields, that can be passed to 'fields' (or
+# pinsoro.load)
+GROUPS = ["metadata"] + CHILD_GROUPS + ["audio", "annotations"]
+
+
+def group_fields(group, child):
+    """ Returns the list of fields of the family 'group' (one of CHILD_GROUPS,
+    or 'annotations') for one child ('purple' or 'yellow').
+    """
+    prefix = child + "_child_"
+
+    if group == "frame_idx":
+        return ["%s_frame_idx" % child]
+    if group == "face":
+        return [prefix + "face%02d_%s" % (i, s) for i in range(NUM_FACIAL_LANDMARKS) for s in 'xy']
+    if group == "skeleton":
+        return [prefix + "skel%02d_%s" % (i, s) for i in range(NUM_SKELETON_KEYPOINTS) for s in 'xy']
+    if group == "head":
+        return [prefix + "head_%s" % k for k in ["x", "y", "z", "rx", "ry", "rz"]]
+    if group == "gaze":
+        return [prefix + "gaze_%s" % k for k in "xyz"]
+    if group == "aus":
+        return [prefix + "au%02d" % au for au in AUS]
+    if group == "motion":
+        return [prefix + "motion_intensity_avg",
+                prefix + "motion_intensity_stdev",
+                prefix + "motion_intensity_max",
+                prefix + "motion_direction_avg",
+                prefix + "motion_direction_stdev"]
+    if group == "annotations":
+        return [prefix + construct for construct in CONSTRUCTS]
+
+    raise ValueError("unknown group of fields '%s' (valid groups: %s)" % (group, ", ".join(GROUPS)))
+
+
+def child_fields(child):
+    """ Returns the list of fields specific to one child ('purple' or
+    'yellow'), in the order they appear in the CSV files (the annotations
+    excepted, which are stored at the end of the rows).
+    """
+    return [f for group in CHILD_GROUPS for f in group_fields(group, child)]
+
+
+METADATA_FIELDS = ["timestamp",
+                   "id",
+                   "condition",
+                   "annotators",
+                   "complete",
+                   "purple_child_age", "purple_child_gender",
+                   "yellow_child_age", "yellow_child_gender"]
+
+AUDIO_FIELDS = ["audio%02d" % i for i in range(NUM_AUDIO_FEATURES)]
+
+ANNOTATION_FIELDS = group_fields("annotations", "purple") + group_fields("annotations", "yellow")
+
+FIELDNAMES = METADATA_FIELDS + \
+             child_fields("purple") + \
+             child_fields("yellow") + \
+             AUDIO_FIELDS + \
+             ANNOTATION_FIELDS
+
+CATEGORICAL_FIELDS = ["id",
+                      "condition",
+                      "annotators",
+                      "purple_child_gender",
+                      "yellow_child_gender"] + ANNOTATION_FIELDS
+
+FLOAT64_FIELDS = ["timestamp"]
+
+BOOLEAN_FIELDS = ["complete"]
+
+
+def fields(groups, child=None):
+    """ Returns the list of fields belonging to the given families of fields,
+    in the order they appear in the CSV files. The timestamp is always
+    included.
+
+    :param groups: a list of groups, taken from GROUPS
+    :param child: 'purple' or 'yellow' to only return the fields of one
+                  child. By default, the fields of both children are returned.
+    """
+    for group in groups:
+        if group not in GROUPS:
+            raise ValueError("unknown group of fields '%s' (valid groups: %s)" % (group, ", ".join(GROUPS)))
+
+    if child is not None and child not in CHILDREN:
+        raise ValueError("unknown child '%s' (valid children: %s)" % (child, ", ".join(CHILDREN)))
+
+    children = CHILDREN if child is None else [child]
+
+    selected = set(["timestamp"])
+    if "metadata" in groups:
+        selected.update(METADATA_FIELDS)
+    if "audio" in groups:
+        selected.update(AUDIO_FIELDS)
+    for group in groups:
+        if group in CHILD_GROUPS or group == "annotations":
+            for c in children:
+                selected.update(group_fields(group, c))
+
+    return [f for f in FIELDNAMES if f in selected]
+
+
+def dtype(field):
+    """ Returns the type to use to load 'field'.
+    """
+    if field in CATEGORICAL_FIELDS:
+        return "category"
+    if field in FLOAT64_FIELDS:
+        return np.float64
+    if field in BOOLEAN_FIELDS:
+        return bool
+    return np.float32
+
+# types of all the fields, to be passed to pandas.read_csv(dtype=...). The
+# 'complete' field is written as 0 or 1 by collate_full_dataset: without an
+# explicit type, pandas would parse it as 64-bit integers.
+DTYPES = {f: dtype(f) for f in FIELDNAMES}
@@ -0,0 +1,58 @@
+"""
+Fixtures shared by the tests of the tools: the tools are plain scripts and
+modules of the tools/ directory, and the records are small synthetic
+pinsoro-*.csv files.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matplotlib
+matplotlib.use("Agg")
+
+import schema
+
+FPS = 30.
+
+
+def write_record(path, duration, start=1496309538.176709, record_id="2017-06-01-102743523980"):
+    """ Writes a synthetic record of 'duration' seconds (at 30Hz) into the
+    CSV file 'path', with all the fields of the schema.
+    """
+    rng = np.random.default_rng(0)
+    n = int(duration * FPS)
+
+    data = pd.DataFrame(rng.random((n, len(schema.FIELDNAMES)), dtype=np.float32), columns=schema.FIELDNAMES)
+    data["timestamp"] = start + np.arange(n) / FPS
+    data["id"] = record_id
+    data["condition"] = "childchild"
+    data["annotators"] = ""
+    data["complete"] = 1 # as written by collate_full_dataset
+    for child in schema.CHILDREN:
+        data["%s_child_gender" % child] = "female"
+        data["%s_frame_idx" % child] = np.arange(n)
+        data["%s_child_gaze_z" % child] = -0.8
+    for field in schema.ANNOTATION_FIELDS:
+        data[field] = ""
+
+    data.to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture
+def make_record(tmp_path):
+    """ Returns a function creating synthetic records in a temporary
+    directory: make_record(duration, name="record") -> path
+    """
+    def make(duration, name="record", **kwargs):
+        directory = tmp_path / name
+        directory.mkdir()
+        return write_record(str(directory / ("pinsoro-%s.csv" % name)), duration, **kwargs)
+
+    return make
@@ -0,0 +1,53 @@
+import os
+
+import yaml
+
+from corpusindex import CorpusIndex
+
+
+def make_dataset(root, records):
+    """ Creates the meta-data files of the records {name: (condition, bag
+    duration or None if the record has no freeplay.bag.yaml)}.
+    """
+    for name, (condition, duration) in records.items():
+        path = os.path.join(str(root), name)
+        os.makedirs(path)
+
+        expe = {"condition": condition,
+                "purple-participant": {"age": 4, "gender": "female", "details": {"tablet-familiarity": 1}}}
+        if condition == "childchild":
+            expe["yellow-participant"] = {"age": 5, "gender": "male"}
+        with open(os.path.join(path, "experiment.yaml"), 'w') as f:
+            yaml.dump(expe, f)
+
+        if duration is not None:
+            with open(os.path.join(path, "freeplay.bag.yaml"), 'w') as f:
+                yaml.dump({"start": 1496309538., "duration": duration,
+                           "topics": [{"topic": "/tf", "messages": 100}]}, f)
+
+
+def test_filter(tmp_path):
+    make_dataset(tmp_path, {"a": ("childchild", 600.), "b": ("childrobot", 300.)})
+
+    index = CorpusIndex(str(tmp_path))
+    assert index.update() == (2, 0)
+    assert index.update() == (0, 0)
+
+    assert index.filter("condition == 'childrobot'") == [os.path.join(str(tmp_path), "b")]
+    assert index.filter("duration > 400 and age == 4.5") == [os.path.join(str(tmp_path), "a")]
+    assert len(index.filter("messages['/tf'] == 100")) == 2
+
+
+def test_records_without_bag_description_are_skipped(tmp_path):
+    make_dataset(tmp_path, {"a": ("childchild", 600.), "nobag": ("childchild", None)})
+
+    index = CorpusIndex(str(tmp_path))
+    index.update()
+
+    assert len(index) == 1
+    assert index.filter("duration < 100") == []
+
+    # a record whose description disappears is removed from the index
+    os.remove(os.path.join(str(tmp_path), "a", "freeplay.bag.yaml"))
+    assert index.update() == (0, 1)
+    assert len(index) == 0
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import schema
+import timeline
+from framestore import FrameStore
+
+
+################## user-003
+
+@pytest.mark.parametrize("group, nb_points", [("face", schema.NUM_FACIAL_LANDMARKS),
+                                              ("skeleton", schema.NUM_SKELETON_KEYPOINTS)])
+def test_keypoints(make_record, tmp_path, group, nb_points):
+    path = make_record(2.)
+    store = FrameStore(path, cachedir=str(tmp_path / "cache"))
+
+    for child in schema.CHILDREN:
+        keypoints = store.keypoints(child, group)
+
+        assert keypoints.shape == (len(store), nb_points, 2)
+        assert keypoints.dtype == np.float32
+
+        # a read-only view on the store, not a copy
+        assert np.shares_memory(keypoints, store.frames)
+        assert not keypoints.flags.writeable
+
+        fields = schema.group_fields(group, child)
+        expected = pd.read_csv(path, usecols=fields, dtype=schema.DTYPES)[fields].values
+        np.testing.assert_array_equal(keypoints.reshape(len(store), -1), expected)
+
+
+def test_keypoints_unknown_group(make_record, tmp_path):
+    store = FrameStore(make_record(1.), cachedir=str(tmp_path / "cache"))
+
+    with pytest.raises(ValueError):
+        store.keypoints("purple", "head")
+
+
+################## user-010
+
+def test_annotations(make_record, tmp_path):
+    path = make_record(1.)
+    field = "yellow_child_social_attitude"
+
+    data = pd.read_csv(path)
+    data[field] = ["prosocial", "", "passive+prosocial"] * 10
+    data.to_csv(path, index=False)
+
+    store = FrameStore(path, cachedir=str(tmp_path / "cache"))
+    labels, disagreement = store.annotations("yellow", "social_attitude")
+
+    prosocial, passive = timeline.SOCIALATTITUDE.index("prosocial"), timeline.SOCIALATTITUDE.index("passive")
+    assert labels.shape == (len(store), 2)
+    np.testing.assert_array_equal(labels[:3], [[prosocial, -1], [-1, -1], [prosocial, passive]])
+    np.testing.assert_array_equal(disagreement[:3], [False, False, True])
+
+    # decoded once
+    assert store.annotations("yellow", "social_attitude")[0] is labels
+
+    # the other child was not annotated
+    labels, disagreement = store.annotations("purple", "social_attitude")
+    assert (labels == -1).all() and not disagreement.any()
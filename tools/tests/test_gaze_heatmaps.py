@@ -0,0 +1,32 @@
+import os
+import importlib.machinery
+import importlib.util
+
+TOOLS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# gaze_heatmaps is a script, without .py extension
+loader = importlib.machinery.SourceFileLoader("gaze_heatmaps", os.path.join(TOOLS, "gaze_heatmaps"))
+gaze_heatmaps = importlib.util.module_from_spec(importlib.util.spec_from_loader(loader.name, loader))
+loader.exec_module(gaze_heatmaps)
+
+
+################## user-016
+
+def test_find_csv_skips_duplicated_records(tmp_path):
+    files = ["2017-06-01-102743523980/pinsoro-2017-06-01-102743523980.csv",
+             "2017-06-01-102743523980/pinsoro-complete-annotator1.csv",
+             "2017-06-01-102743523980/pinsoro-complete-annotator2.csv",
+             "2017-06-02-111832107346/pinsoro-2017-06-02-111832107346.csv",
+             "2017-06-02-111832107346/pinsoro-complete-no-annotations.csv",
+             "exclude_2017-06-03-090000000000/pinsoro-exclude_2017-06-03-090000000000.csv"]
+    for f in files:
+        (tmp_path / f).parent.mkdir(exist_ok=True)
+        (tmp_path / f).touch()
+
+    expected = [str(tmp_path / files[0]), str(tmp_path / files[3])]
+    assert gaze_heatmaps.find_csv([str(tmp_path)]) == expected
+
+    # the directory of a record itself, and explicit files
+    record = str(tmp_path / "2017-06-02-111832107346")
+    assert gaze_heatmaps.find_csv([record]) == [str(tmp_path / files[3])]
+    assert gaze_heatmaps.find_csv([str(tmp_path / files[1])]) == [str(tmp_path / files[1])]
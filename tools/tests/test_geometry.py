@@ -0,0 +1,85 @@
+import warnings
+
+import numpy as np
+
+import geometry
+import scene
+
+
+def test_project_on_plane():
+    origins = np.array([[0.1, 0.2, 0.5], [0., 0., 0.3]])
+    directions = np.array([[0., 0., -1.], [0.3, -0.1, -0.3]])
+
+    np.testing.assert_allclose(geometry.project_on_plane(origins, directions),
+                               [[0.1, 0.2, 0.], [0.3, -0.1, 0.]])
+
+
+def test_project_on_plane_rays_missing_the_plane():
+    origins = np.array([[0., 0., 0.5],   # pointing away from the plane
+                        [0., 0., 0.5],   # parallel, above the plane
+                        [0., 0., -0.5],  # parallel, below the plane
+                        [0., 0., 0.]])   # parallel, in the plane
+    directions = np.array([[0., 0., 1.],
+                           [1., 0., 0.],
+                           [1., 0., 0.],
+                           [1., 0., 0.]])
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        hits = geometry.project_on_plane(origins, directions)
+
+    assert np.isnan(hits).all()
+
+
+def test_project_on_plane_with_pose():
+    plane = np.identity(4)
+    plane[2, 3] = 0.1 # plane 10cm above the origin
+
+    hit = geometry.project_on_plane([0., 0., 0.5], [0., 0.5, -0.4], plane)
+    np.testing.assert_allclose(hit, [0., 0.5, 0.])
+
+
+def synthetic_faces(rng, n=10, points=70):
+    """ Returns a (points, 2) reference face, and n (normalised) copies of it,
+    rotated, scaled and translated in the image.
+    """
+    template = rng.normal(scale=0.05, size=(points, 2))
+    angles = rng.uniform(-0.5, 0.5, n)
+    rotations = np.stack([np.stack([np.cos(angles), -np.sin(angles)], -1),
+                          np.stack([np.sin(angles), np.cos(angles)], -1)], -2)
+    faces = rng.uniform(0.8, 1.2, (n, 1, 1)) * np.matmul(template, np.swapaxes(rotations, -1, -2)) + rng.uniform(0.3, 0.6, (n, 1, 2))
+
+    return template, faces / (scene.IMAGE_WIDTH, scene.IMAGE_HEIGHT)
+
+
+def test_align_faces():
+    template, keypoints = synthetic_faces(np.random.default_rng(0))
+
+    landmarks, transforms = geometry.align_faces(keypoints, template)
+
+    assert landmarks.shape == keypoints.shape and landmarks.dtype == np.float32
+    assert transforms.shape == (len(keypoints), 4, 4)
+    np.testing.assert_allclose(landmarks, np.broadcast_to(template, landmarks.shape), atol=1e-6)
+
+    # by default, the landmarks are aligned in the frame of the images
+    explicit, _ = geometry.align_faces(keypoints, template, image_size=(scene.IMAGE_WIDTH, scene.IMAGE_HEIGHT))
+    np.testing.assert_array_equal(landmarks, explicit)
+
+
+def test_align_faces_missing_landmarks():
+    template, keypoints = synthetic_faces(np.random.default_rng(1))
+    keypoints[2] = np.nan # face not detected
+    keypoints[5, 10] = np.nan # one missing landmark
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        landmarks, transforms = geometry.align_faces(keypoints)
+
+        # no face at all
+        missing, missing_transforms = geometry.align_faces(np.full((3, 70, 2), np.nan))
+
+    for frame in (2, 5):
+        assert np.isnan(landmarks[frame]).all() and np.isnan(transforms[frame]).all()
+    assert np.isfinite(np.delete(landmarks, [2, 5], axis=0)).all()
+
+    assert np.isnan(missing).all() and np.isnan(missing_transforms).all()
@@ -0,0 +1,169 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import pinsoro
+import schema
+import timeline
+
+
+################## user-001
+
+def test_cache_rebuilt_when_checksum_changes(make_record, tmp_path):
+    path = make_record(2.)
+    cachedir = str(tmp_path / "cache")
+
+    with open(path + ".md5", 'w') as f:
+        f.write("0123456789abcdef  pinsoro-record.csv\n")
+
+    pinsoro.load(path, cachedir=cachedir)
+    old = pinsoro.cache_path(path, cachedir)
+    assert os.path.basename(old).startswith("pinsoro-record.0123456789abcdef.")
+    assert os.listdir(cachedir) == [os.path.basename(old)]
+
+    # the CSV file changed: the new checksum leads to a new cache, and the
+    # old one is removed
+    with open(path + ".md5", 'w') as f:
+        f.write("fedcba9876543210  pinsoro-record.csv\n")
+
+    data = pinsoro.load(path, cachedir=cachedir)
+    new = pinsoro.cache_path(path, cachedir)
+    assert new != old
+    assert os.listdir(cachedir) == [os.path.basename(new)]
+    assert len(data) == 60
+
+
+def test_remove_stale_caches(tmp_path):
+    current = "pinsoro-a.1111.v%d" % pinsoro.CACHE_VERSION
+    kept = [current + ".npz",
+            current + ".frames.npy",
+            "pinsoro-a.2222.v%d.123.tmp.npz" % pinsoro.CACHE_VERSION, # being built by another process
+            "pinsoro-b.2222.v%d.npz" % pinsoro.CACHE_VERSION] # another record
+    stale = ["pinsoro-a.2222.v%d.npz" % pinsoro.CACHE_VERSION, # other checksum
+             "pinsoro-a.2222.v%d.frames.npy" % pinsoro.CACHE_VERSION,
+             "pinsoro-a.1111.v%d.npz" % (pinsoro.CACHE_VERSION - 1)] # other format
+
+    for name in kept + stale:
+        (tmp_path / name).touch()
+
+    pinsoro.remove_stale_caches(str(tmp_path / (current + ".npz")))
+
+    assert sorted(os.listdir(str(tmp_path))) == sorted(kept)
+
+
+def test_load_groups_equals_read_csv(make_record, tmp_path):
+    path = make_record(2.)
+    columns = schema.fields(["head", "gaze"], "purple")
+
+    expected = pd.read_csv(path, usecols=columns, dtype=schema.DTYPES)[columns]
+
+    for use_cache in (False, True):
+        data = pinsoro.load(path, groups=["head", "gaze"], child="purple",
+                            use_cache=use_cache, cachedir=str(tmp_path / "cache"))
+        assert list(data.columns) == columns
+        assert "timestamp" in data.columns
+        assert not any(c.startswith("yellow_") for c in data.columns)
+        pd.testing.assert_frame_equal(data[columns], expected)
+
+
+def test_cached_load_equals_read_csv(make_record, tmp_path):
+    path = make_record(2.)
+
+    expected = pd.read_csv(path, dtype=schema.DTYPES)
+    data = pinsoro.load(path, cachedir=str(tmp_path / "cache")) # builds the cache
+    data = pinsoro.load(path, cachedir=str(tmp_path / "cache")) # reads it back
+
+    pd.testing.assert_frame_equal(data, expected, check_categorical=False)
+
+
+################## user-005
+
+def test_iterchunks_with_and_without_cache(make_record, tmp_path):
+    path = make_record(5.) # 150 frames
+    columns = pinsoro.chunk_columns(["head", "gaze"], "purple")
+    expected = pd.read_csv(path, dtype=schema.DTYPES)
+
+    for use_cache in (False, True):
+        chunks = list(pinsoro.iterchunks(path, chunksize=40, groups=["head", "gaze"], child="purple",
+                                         use_cache=use_cache, cachedir=str(tmp_path / "cache")))
+
+        assert [len(frames) for _, frames in chunks] == [40, 40, 40, 30]
+        assert all(frames.shape[1] == len(columns) and frames.dtype == np.float32 for _, frames in chunks)
+
+        timestamps = np.concatenate([t for t, _ in chunks])
+        frames = np.concatenate([f for _, f in chunks])
+        np.testing.assert_array_equal(timestamps, expected["timestamp"].values)
+        np.testing.assert_array_equal(frames, expected[columns].values.astype(np.float32))
+
+
+def test_iterchunks_all_fields(make_record, tmp_path):
+    path = make_record(2.)
+    columns = pinsoro.chunk_columns()
+
+    assert "timestamp" not in columns
+    assert not set(columns) & set(schema.CATEGORICAL_FIELDS)
+
+    cached = list(pinsoro.iterchunks(path, chunksize=25, cachedir=str(tmp_path / "cache")))
+    parsed = list(pinsoro.iterchunks(path, chunksize=25, use_cache=False))
+
+    assert len(cached) == len(parsed) == 3
+    for (t1, f1), (t2, f2) in zip(cached, parsed):
+        np.testing.assert_array_equal(t1, t2)
+        np.testing.assert_array_equal(f1, f2)
+    assert (np.concatenate([f for _, f in cached])[:, columns.index("complete")] == 1.).all()
+
+
+################## user-010
+
+def test_decode_annotations_disagreement():
+    vocab = timeline.TASKENGAGEMENT
+    goal, aimless, noplay = (vocab.index(l) for l in (timeline.GOALORIENTED, timeline.AIMLESS, timeline.NOPLAY))
+
+    categories = ["goaloriented", "noplay+aimless", "noplay+goaloriented+aimless"]
+    codes = np.array([-1, 0, 1, 2, 0, -1], dtype=np.float32) # as stored in a frame store
+
+    labels, disagreement = pinsoro.decode_annotations(codes, categories, vocab)
+
+    assert labels.dtype == np.int8
+    np.testing.assert_array_equal(labels, [[-1, -1, -1],
+                                           [goal, -1, -1],
+                                           sorted([aimless, noplay]) + [-1],
+                                           sorted([goal, aimless, noplay]),
+                                           [goal, -1, -1],
+                                           [-1, -1, -1]])
+    np.testing.assert_array_equal(disagreement, [False, False, True, True, False, False])
+
+
+def test_decode_annotations_agreement():
+    labels, disagreement = pinsoro.decode_annotations([1, -1, 0], ["solitary", "parallel"],
+                                                      timeline.SOCIALENGAGEMENT)
+
+    assert labels.shape == (3, 1)
+    np.testing.assert_array_equal(labels[:, 0], [timeline.SOCIALENGAGEMENT.index(timeline.PARALLEL),
+                                                 -1,
+                                                 timeline.SOCIALENGAGEMENT.index(timeline.SOLITARY)])
+    assert not disagreement.any()
+
+    # no annotation at all
+    labels, disagreement = pinsoro.decode_annotations([-1, -1], [], timeline.SOCIALENGAGEMENT)
+    np.testing.assert_array_equal(labels, [[-1], [-1]])
+    assert not disagreement.any()
+
+
+def test_decode_annotations_of_loaded_record(make_record, tmp_path):
+    path = make_record(1.)
+    field = "purple_child_task_engagement"
+
+    data = pd.read_csv(path)
+    data[field] = ["goaloriented", "aimless+goaloriented", ""] * 10
+    data.to_csv(path, index=False)
+
+    data = pinsoro.load(path, cachedir=str(tmp_path / "cache"))
+    labels, disagreement = pinsoro.decode_annotations(data[field].cat.codes,
+                                                      data[field].cat.categories,
+                                                      pinsoro.vocabulary(field))
+
+    goal, aimless = timeline.TASKENGAGEMENT.index("goaloriented"), timeline.TASKENGAGEMENT.index("aimless")
+    np.testing.assert_array_equal(labels[:3], [[goal, -1], sorted([goal, aimless]), [-1, -1]])
+    np.testing.assert_array_equal(disagreement[:3], [False, True, False])
@@ -0,0 +1,29 @@
+import numpy as np
+
+from profiling import StageTimer, FRAME
+
+
+def make_timer():
+    timer = StageTimer()
+    timer.timings = {FRAME: [0.010, 0.020, 0.030, 0.100],
+                     "draw": [0.005, 0.010, 0.020, 0.090]}
+    return timer
+
+
+def test_histogram():
+    counts, edges = make_timer().histogram("draw", bins=4)
+
+    assert counts.sum() == 4
+    assert edges[0] == 0.005 and edges[-1] >= 0.090
+    np.testing.assert_allclose(edges[1:] / edges[:-1], edges[1] / edges[0])
+
+
+def test_histograms():
+    text = make_timer().histograms(bins=4, width=10)
+    lines = text.splitlines()
+
+    assert lines[0] == "frame:" and lines[5] == "draw:"
+    assert len(lines) == 10
+    assert max(line.count("#") for line in lines) == 10
+
+    assert StageTimer().histograms() == "No frame rendered."
@@ -0,0 +1,30 @@
+import pytest
+
+import schema
+
+
+def test_fields():
+    assert len(schema.FIELDNAMES) == 449
+
+    fields = schema.fields(["head"], child="purple")
+    assert fields == ["timestamp"] + schema.group_fields("head", "purple")
+
+    assert len(schema.fields(["head"])) == 1 + 2 * 6
+
+
+def test_unknown_group_or_child():
+    with pytest.raises(ValueError):
+        schema.fields(["hands"])
+
+    with pytest.raises(ValueError):
+        schema.fields(["head"], child="green")
+
+
+def test_complete_is_boolean(make_record, tmp_path):
+    import pinsoro
+
+    data = pinsoro.read_csv(make_record(1.))
+    assert data["complete"].dtype == bool
+    assert data["complete"].all()
+
+    assert pinsoro.load(make_record(1., "cached"), cachedir=str(tmp_path / "cache"))["complete"].dtype == bool
@@ -0,0 +1,37 @@
+import numpy as np
+
+from framestore import FrameStore
+from timeindex import TimeIndex
+
+
+def test_frames_between_timestamps(make_record, tmp_path):
+    store = FrameStore(make_record(10.), cachedir=str(tmp_path / "cache"))
+    index = TimeIndex.from_store(store)
+
+    # as documented in timeindex.py
+    start, end = index.relative(2.), index.relative(5.)
+    r = index.frames(start, end)
+    frames = store.range(r.start, r.stop)
+
+    assert len(frames) == 90
+    timestamps = store.timestamps[r.start:r.stop]
+    assert timestamps[0] >= start and timestamps[-1] < end
+    np.testing.assert_array_equal(frames, store.frames[60:150])
+
+
+def test_frames_past_the_end(make_record, tmp_path):
+    store = FrameStore(make_record(2.), cachedir=str(tmp_path / "cache"))
+    index = TimeIndex.from_store(store)
+
+    r = index.frames(index.relative(3.))
+    assert r.start == r.stop == len(index)
+    assert len(store.range(r.start, r.stop)) == 0
+
+
+def test_frame_at(make_record, tmp_path):
+    store = FrameStore(make_record(2.), cachedir=str(tmp_path / "cache"))
+    index = TimeIndex.from_store(store)
+
+    assert index.frame_at(index.relative(1.)) == 30
+    assert index.frame_at(index.start - 1.) == 0
+    np.testing.assert_array_equal(index.frame_at(index.relative(np.array([0., 0.5, 100.]))), [0, 15, 59])
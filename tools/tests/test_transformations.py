@@ -0,0 +1,285 @@
+"""
+The batched functions of transformations.py, compared with their scalar
+versions, one matrix (or quaternion) at a time.
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+import transformations as tr
+
+AXES = sorted(tr._AXES2TUPLE)
+
+# pitch angles (the middle Euler angle) at and around gimbal lock
+GIMBAL_LOCK = [-math.pi / 2, math.pi / 2, 0., math.pi, -math.pi]
+
+
+def random_angles(rng, n=20):
+    """ Returns (ai, aj, ak) arrays of n random angles, the last ones at
+    gimbal lock (for the 'sxyz'-like conventions) or at the boundaries of
+    the repeated ones.
+    """
+    ai, aj, ak = (4. * math.pi) * (rng.random((3, n)) - 0.5)
+    aj[-len(GIMBAL_LOCK):] = GIMBAL_LOCK
+    return ai, aj, ak
+
+
+def random_transforms(rng, n=20):
+    """ Returns random (scale, shear, angles, translate, perspective) arrays
+    of n transformations.
+    """
+    scale = rng.random((n, 3)) + 0.5
+    scale[::3] *= -1
+    shear = rng.random((n, 3)) - 0.5
+    angles = (rng.random((n, 3)) - 0.5) * (2 * math.pi)
+    angles[:len(GIMBAL_LOCK), 1] = GIMBAL_LOCK
+    translate = rng.random((n, 3)) - 0.5
+    perspective = np.concatenate([(rng.random((n, 3)) - 0.5) * 0.2, np.ones((n, 1))], axis=-1)
+    return scale, shear, angles, translate, perspective
+
+
+################## user-021
+
+def test_translation_matrices():
+    v = np.random.default_rng(0).random((4, 5, 3)) - 0.5
+
+    M = tr.translation_matrices(v)
+    assert M.shape == (4, 5, 4, 4)
+    for idx in np.ndindex(v.shape[:-1]):
+        np.testing.assert_array_equal(M[idx], tr.translation_matrix(v[idx]))
+
+
+@pytest.mark.parametrize("axes", AXES)
+def test_euler_matrices(axes):
+    ai, aj, ak = random_angles(np.random.default_rng(1))
+
+    R = tr.euler_matrices(ai, aj, ak, axes)
+    for n in range(len(ai)):
+        np.testing.assert_allclose(R[n], tr.euler_matrix(ai[n], aj[n], ak[n], axes), atol=1e-15)
+
+
+def test_euler_matrices_broadcast():
+    ai, aj, ak = random_angles(np.random.default_rng(2))
+
+    R = tr.euler_matrices(ai[:, np.newaxis], aj[np.newaxis, :], 0.3)
+    assert R.shape == (len(ai), len(aj), 4, 4)
+    np.testing.assert_allclose(R[2, 5], tr.euler_matrix(ai[2], aj[5], 0.3), atol=1e-15)
+
+
+@pytest.mark.parametrize("axes", AXES)
+def test_quaternions_from_euler(axes):
+    ai, aj, ak = random_angles(np.random.default_rng(3))
+
+    q = tr.quaternions_from_euler(ai, aj, ak, axes)
+    for n in range(len(ai)):
+        np.testing.assert_allclose(q[n], tr.quaternion_from_euler(ai[n], aj[n], ak[n], axes), atol=1e-15)
+
+
+def test_quaternion_matrices():
+    rng = np.random.default_rng(4)
+    q = rng.random((20, 4)) - 0.5
+    q[0] = 0. # null quaternion: identity
+    q[1] = [0., 0., 0., -1.]
+
+    M = tr.quaternion_matrices(q)
+    for n in range(len(q)):
+        np.testing.assert_allclose(M[n], tr.quaternion_matrix(q[n]), atol=1e-15)
+
+
+@pytest.mark.parametrize("components", [(0, 2, 3), (0, 1, 2, 3), (0, 1, 2, 3, 4), (2,), (3,)])
+def test_compose_matrices(components):
+    """ compose_matrices with some of (scale, shear, angles, translate,
+    perspective) set, the others None.
+    """
+    transforms = random_transforms(np.random.default_rng(5))
+    args = [t if i in components else None for i, t in enumerate(transforms)]
+
+    M = tr.compose_matrices(*args)
+    for n in range(len(M)):
+        expected = tr.compose_matrix(*[None if a is None else a[n] for a in args])
+        np.testing.assert_allclose(M[n], expected, rtol=1e-12, atol=1e-15)
+
+
+def test_compose_matrices_shared_vector():
+    scale, shear, angles, translate, perspective = random_transforms(np.random.default_rng(6))
+
+    M = tr.compose_matrices(scale[0], None, angles, translate[0])
+    for n in range(len(M)):
+        np.testing.assert_allclose(M[n], tr.compose_matrix(scale[0], None, angles[n], translate[0]), atol=1e-15)
+
+
+################## user-022
+
+def rotations(rng, n=20):
+    """ Returns n rotation matrices: random ones, and rotations by pi around
+    the x, y and z axes (the branches of quaternion_from_matrix).
+    """
+    R = tr.euler_matrices(*random_angles(rng, n))
+    R[:3] = [tr.rotation_matrix(math.pi, axis) for axis in np.identity(3)]
+    return R
+
+
+@pytest.mark.parametrize("components", [(0, 2, 3), (0, 1, 2, 3), (0, 1, 2, 3, 4), (2, 4)])
+def test_decompose_matrices(components):
+    """ decompose_matrices of matrices with shear and/or perspective.
+    """
+    transforms = random_transforms(np.random.default_rng(7))
+    args = [t if i in components else None for i, t in enumerate(transforms)]
+    M = tr.compose_matrices(*args)
+
+    result = tr.decompose_matrices(M)
+    for n in range(len(M)):
+        scale, shear, angles, translate, perspective = tr.decompose_matrix(M[n])
+
+        np.testing.assert_allclose(result[0][n], scale, rtol=1e-9)
+        np.testing.assert_allclose(result[1][n], shear, atol=1e-9)
+        np.testing.assert_allclose(result[3][n], translate, atol=1e-12)
+        np.testing.assert_allclose(result[4][n], perspective, atol=1e-12)
+
+        # at gimbal lock, the angles are ill-conditioned: only the rotations
+        # they describe are compared
+        np.testing.assert_allclose(tr.euler_matrix(*result[2][n]), tr.euler_matrix(*angles), atol=1e-7)
+        if abs(math.cos(angles[1])) > 1e-6:
+            np.testing.assert_allclose(result[2][n], angles, atol=1e-9)
+
+    # as with decompose_matrix, the matrices with shear at gimbal lock are
+    # not recomposed exactly
+    regular = np.abs(np.cos(result[2][:, 1])) > 1e-6
+    np.testing.assert_allclose(tr.compose_matrices(*result)[regular], (M / M[:, 3:, 3:])[regular], atol=1e-9)
+
+
+def test_decompose_matrices_singular():
+    M = np.tile(np.identity(4), (3, 1, 1))
+    M[1, 2, :3] = 0.
+
+    with pytest.raises(ValueError):
+        tr.decompose_matrices(M)
+
+    M = np.tile(np.identity(4), (3, 1, 1))
+    M[2, 3, 3] = 0.
+
+    with pytest.raises(ValueError):
+        tr.decompose_matrices(M)
+
+
+@pytest.mark.parametrize("axes", AXES)
+def test_euler_from_matrices(axes):
+    ai, aj, ak = random_angles(np.random.default_rng(8))
+    R = tr.euler_matrices(ai, aj, ak, axes)
+
+    angles = np.stack(tr.euler_from_matrices(R, axes), axis=-1)
+    for n in range(len(R)):
+        np.testing.assert_allclose(angles[n], tr.euler_from_matrix(R[n], axes), atol=1e-12)
+
+    # 3x3 matrices
+    np.testing.assert_array_equal(np.stack(tr.euler_from_matrices(R[:, :3, :3], axes), axis=-1), angles)
+    np.testing.assert_allclose(tr.euler_matrices(*tr.euler_from_matrices(R, axes), axes=axes), R, atol=1e-12)
+
+
+def test_quaternion_from_matrices():
+    R = rotations(np.random.default_rng(9))
+
+    q = tr.quaternion_from_matrices(R)
+    for n in range(len(R)):
+        np.testing.assert_allclose(q[n], tr.quaternion_from_matrix(R[n]), atol=1e-15)
+
+    np.testing.assert_allclose(tr.quaternion_matrices(q), R, atol=1e-15)
+
+
+################## user-023
+
+def quaternion_pairs(rng, n=20):
+    """ Returns (q0, q1) arrays of n pairs of quaternions: random ones,
+    identical ones, opposite ones, and nearly opposite ones.
+    """
+    q0 = np.array([tr.random_quaternion(rng.random(3)) for _ in range(n)])
+    q1 = np.array([tr.random_quaternion(rng.random(3)) for _ in range(n)])
+    q1[0] = q0[0]
+    q1[1] = -q0[1]
+    q1[2] = -q0[2] + 1e-3
+    q1[3] = q0[3] * 2. # not normalised
+    return q0, q1
+
+
+@pytest.mark.parametrize("spin", [0, 1])
+@pytest.mark.parametrize("shortestpath", [True, False])
+@pytest.mark.parametrize("fraction", [0., 1., 0.5, "random"])
+def test_quaternion_slerps(fraction, shortestpath, spin):
+    rng = np.random.default_rng(10)
+    q0, q1 = quaternion_pairs(rng)
+    fraction = rng.random(len(q0)) if fraction == "random" else np.full(len(q0), fraction)
+
+    q = tr.quaternion_slerps(q0, q1, fraction, spin=spin, shortestpath=shortestpath)
+    for n in range(len(q0)):
+        expected = tr.quaternion_slerp(q0[n], q1[n], fraction[n], spin=spin, shortestpath=shortestpath)
+        np.testing.assert_allclose(q[n], expected, atol=1e-12)
+
+
+def test_quaternion_slerps_ends():
+    q0, q1 = quaternion_pairs(np.random.default_rng(11))
+    unit = q1 / np.linalg.norm(q1, axis=-1, keepdims=True)
+
+    np.testing.assert_allclose(tr.quaternion_slerps(q0, q1, 0.), q0, atol=1e-15)
+    # as quaternion_slerp, fraction 1 returns quat1, even if opposite to quat0
+    np.testing.assert_allclose(tr.quaternion_slerps(q0, q1, 1.), unit, atol=1e-15)
+    # opposite quaternions: quat0
+    np.testing.assert_allclose(tr.quaternion_slerps(q0[1], q1[1], 0.3), q0[1], atol=1e-15)
+
+
+def test_quaternion_slerps_broadcast():
+    q0, q1 = quaternion_pairs(np.random.default_rng(12))
+    fractions = np.linspace(0., 1., 7)
+
+    # one reference quaternion, several targets and fractions
+    q = tr.quaternion_slerps(q0[5], q1[:, np.newaxis], fractions)
+    assert q.shape == (len(q1), len(fractions), 4)
+    np.testing.assert_allclose(q[7, 3], tr.quaternion_slerp(q0[5], q1[7], fractions[3]), atol=1e-12)
+
+
+################## user-024
+
+def vector_sets(rng, n=10, points=20):
+    """ Returns a reference set v0 of shape (4, points), and n sets v1
+    (n, 4, points): v0 transformed by random rigid transformations and
+    scalings, plus noise, the first one mirrored.
+    """
+    v0 = np.ones((4, points))
+    v0[:3] = (rng.random((3, points)) - 0.5) * 20.
+
+    M = tr.compose_matrices(scale=np.repeat(rng.random((n, 1)) + 0.5, 3, axis=-1),
+                            angles=(rng.random((n, 3)) - 0.5) * (2 * math.pi),
+                            translate=rng.random((n, 3)) - 0.5)
+    M[0] = np.dot(M[0], tr.scale_matrix(-1.))
+
+    v1 = np.matmul(M, v0)
+    v1[:, :3] += rng.normal(0., 0.01, (n, 3, points))
+    return v0, v1
+
+
+@pytest.mark.parametrize("usesvd", [True, False])
+@pytest.mark.parametrize("scaling", [True, False])
+def test_superimposition_matrices(scaling, usesvd):
+    v0, v1 = vector_sets(np.random.default_rng(13))
+
+    M = tr.superimposition_matrices(v0, v1, scaling=scaling, usesvd=usesvd)
+    assert M.shape == (len(v1), 4, 4)
+    for n in range(len(v1)):
+        np.testing.assert_allclose(M[n], tr.superimposition_matrix(v0, v1[n], scaling=scaling, usesvd=usesvd), atol=1e-12)
+
+    # both sets per frame
+    M = tr.superimposition_matrices(np.broadcast_to(v0, v1.shape), v1, scaling=scaling, usesvd=usesvd)
+    np.testing.assert_allclose(M[4], tr.superimposition_matrix(v0, v1[4], scaling=scaling, usesvd=usesvd), atol=1e-12)
+
+
+def test_superimposition_matrices_shapes():
+    v0, v1 = vector_sets(np.random.default_rng(14))
+
+    # 3D vectors, without the homogeneous coordinate
+    np.testing.assert_allclose(tr.superimposition_matrices(v0[:3], v1[:, :3]), tr.superimposition_matrices(v0, v1))
+
+    with pytest.raises(ValueError):
+        tr.superimposition_matrices(v0, v1[..., :-1])
+    with pytest.raises(ValueError):
+        tr.superimposition_matrices(v0[:, :2], v1[..., :2])
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+import matplotlib.animation as animation
+
+import visualise_dataset
+from framestore import FrameStore
+
+requires_ffmpeg = pytest.mark.skipif(not animation.writers.is_available("ffmpeg"),
+                                     reason="saving videos needs ffmpeg")
+
+
+def test_update_renders_a_frame(make_record, tmp_path):
+    store = FrameStore(make_record(1.), cachedir=str(tmp_path / "cache"))
+    faces = visualise_dataset.precompute_faces(store, 0, len(store))
+    gizmos = visualise_dataset.precompute_gizmos(store, 0, len(store))
+
+    fig, ax, plots, time_text, ann_labels = visualise_dataset.create_scene()
+
+    for num in [0, 10]:
+        artists = visualise_dataset.update(num, store, faces, gizmos, plots, time_text, ann_labels)
+        fig.canvas.draw()
+
+    assert artists == visualise_dataset.dynamic_artists(plots, time_text, ann_labels)
+
+    # the purple head marker is at the head position of the frame
+    xs, ys, zs = plots[2][0].get_data_3d()
+    np.testing.assert_allclose([xs[0], ys[0], zs[0]],
+                               [store.value(10, "purple_child_head_%s" % c) for c in "xyz"])
+    assert time_text.get_text().startswith("frame #10")
+
+
+def test_scene_box_aspect():
+    fig, ax, plots, time_text, ann_labels = visualise_dataset.create_scene()
+
+    # the box of the scene has the proportions of the axes ranges
+    ranges = np.array([0.8, 1.2, 0.7])
+    np.testing.assert_allclose(ax.get_box_aspect() / ax.get_box_aspect()[0], ranges / ranges[0])
+
+
+@requires_ffmpeg
+def test_grid_records_of_different_lengths(make_record, tmp_path):
+    # the short record ends before the played range starts
+    paths = [make_record(4., "long"), make_record(2., "short")]
+
+    video = str(tmp_path / "grid.mp4")
+    visualise_dataset.play_grid(paths, start_time=3., video=video, cachedir=str(tmp_path / "cache"))
+
+    assert (tmp_path / "grid.mp4").stat().st_size > 0
+
+
+@requires_ffmpeg
+def test_grid_played_range_within_all_records(make_record, tmp_path):
+    paths = [make_record(3., "long"), make_record(2., "short")]
+
+    video = str(tmp_path / "grid.mp4")
+    visualise_dataset.play_grid(paths, start_time=1., video=video, cachedir=str(tmp_path / "cache"))
+
+    assert (tmp_path / "grid.mp4").stat().st_size > 0
+
+
+def test_grid_all_records_finished(make_record, tmp_path):
+    paths = [make_record(2., "a"), make_record(1., "b")]
+
+    video = str(tmp_path / "grid.mp4")
+    visualise_dataset.play_grid(paths, start_time=10., video=video, cachedir=str(tmp_path / "cache"))
+
+    assert not (tmp_path / "grid.mp4").exists()
@@ -0,0 +1,191 @@
+"""
+Reference frames of the PInSoRo setup, and the transformations between them.
+
+A TransformGraph is a small, ROS tf-like, tree of reference frames: each
+frame is attached to a parent frame by its pose in that frame (a 4x4
+matrix, or a stack of (N, 4, 4) matrices for a frame that moves over the
+frames of a record, like the head of a child). lookup() returns the
+transformation between any two frames of the tree: the chains of
+transformations to the root of the tree, their inverses and the resulting
+transformations are computed once, and cached.
+
+DEFAULT_GRAPH holds the static frames of the setup, as published on /tf
+during the recordings (cf the README): the centre of the interactive table
+(sandtray_centre, the reference frame of the dataset), its corner (sandtray),
+and the optical frames of the two children-facing cameras
+(camera_{purple,yellow}_rgb_optical_frame):
+
+    from tfgraph import DEFAULT_GRAPH, SANDTRAY_CENTRE, camera_frame
+
+    # facial landmarks, in the purple camera frame -> table frame
+    points = DEFAULT_GRAPH.transform_points(points, camera_frame("purple"), SANDTRAY_CENTRE)
+
+License: CC-0
+"""
+
+import numpy as np
+
+import transformations
+import geometry
+
+SANDTRAY_CENTRE = "sandtray_centre"
+SANDTRAY = "sandtray"
+
+
+def camera_frame(child):
+    """ Returns the name of the optical frame of the camera facing 'child'.
+    """
+    return "camera_%s_rgb_optical_frame" % child
+
+
+# Obtained with the following steps:
+# $ rosparam set /use_sim_time True
+# $ rosbag play --clock freeplay.bag
+# $ rosrun tf static_transform_publisher -0.3 0.169 0 0 0 0 sandtray_centre sandtray 20
+# $ rosrun tf tf_echo sandtray_centre camera_{purple|yellow}_rgb_optical_frame
+SANDTRAY_TRANSLATION=[-0.3, 0.169, 0]
+
+YELLOW_CAM_TO_CENTRE_QUATERNION=[-0.530, 0.220, -0.314, 0.757]
+YELLOW_CAM_TO_CENTRE_TRANSLATION=[-0.408, -0.208, 0.035]
+
+PURPLE_CAM_TO_CENTRE_QUATERNION=[0.220, -0.530, 0.757, -0.314]
+PURPLE_CAM_TO_CENTRE_TRANSLATION=[-0.408, 0.190, 0.035]
+
+
+class TransformGraph:
+    """ Tree of reference frames.
+
+    Transformations follow tf's conventions: the transformation of a frame
+    in its parent frame maps the points expressed in the frame into the
+    parent frame.
+    """
+
+    def __init__(self):
+
+        # {frame: (parent frame, pose of the frame in the parent frame)}
+        self._parents = {}
+
+        # cached transformations: {frame: (root, pose in the root frame, inverse)},
+        # {(target, source): transformation}
+        self._roots = {}
+        self._lookups = {}
+
+    @property
+    def frames(self):
+        """ The names of all the frames of the graph.
+        """
+        return set(self._parents) | set(parent for parent, _ in self._parents.values())
+
+    def add(self, parent, frame, transform):
+        """ Attaches 'frame' to the frame 'parent'.
+
+        :param transform: the pose of 'frame' in 'parent': a 4x4 matrix, or a
+                          stack of (N, 4, 4) matrices if the frame moves (eg,
+                          the head poses of a whole record, cf
+                          geometry.head_poses)
+        """
+        if frame in self._parents:
+            raise ValueError("Frame '%s' already has a parent ('%s')" % (frame, self._parents[frame][0]))
+
+        ancestor = parent
+        while ancestor in self._parents:
+            if ancestor == frame:
+                break
+            ancestor = self._parents[ancestor][0]
+        if ancestor == frame:
+            raise ValueError("Attaching '%s' to '%s' would create a loop" % (frame, parent))
+
+        self._parents[frame] = (parent, self._readonly(np.array(transform, dtype=np.float64)))
+
+        # the cached chains might go through the new frame
+        self._roots.clear()
+        self._lookups.clear()
+
+    def add_static(self, parent, frame, translation, quaternion=(0., 0., 0., 1.)):
+        """ Attaches 'frame' to 'parent', like tf's static_transform_publisher:
+        'translation' (x, y, z) and 'quaternion' (x, y, z, w) are the position
+        and orientation of 'frame' in 'parent'.
+        """
+        self.add(parent, frame, np.dot(transformations.translation_matrix(translation),
+                                       transformations.quaternion_matrix(quaternion)))
+
+    def _root(self, frame):
+        """ Returns (root, pose of 'frame' in the root frame, its inverse).
+        """
+        if frame not in self._roots:
+            if frame in self._parents:
+                parent, transform = self._parents[frame]
+                root, pose, _ = self._root(parent)
+                pose = np.matmul(pose, transform)
+                self._roots[frame] = (root, self._readonly(pose), self._readonly(np.linalg.inv(pose)))
+            elif frame in self.frames:
+                identity = self._readonly(np.identity(4))
+                self._roots[frame] = (frame, identity, identity)
+            else:
+                raise ValueError("Unknown frame '%s'" % frame)
+
+        return self._roots[frame]
+
+    def lookup(self, target, source):
+        """ Returns the transformation mapping the points expressed in
+        'source' into 'target', ie, the pose of 'source' in 'target' (as
+        'tf_echo <target> <source>' does): a 4x4 matrix, or a (N, 4, 4) stack
+        if any of the frames between them moves.
+
+        The returned arrays are cached, and read-only.
+        """
+        key = (target, source)
+
+        if key not in self._lookups:
+            source_root, pose, _ = self._root(source)
+            target_root, _, inverse = self._root(target)
+            if source_root != target_root:
+                raise ValueError("Frames '%s' and '%s' are not connected" % (source, target))
+
+            self._lookups[key] = self._readonly(np.matmul(inverse, pose))
+
+        return self._lookups[key]
+
+    def transform_points(self, points, source, target):
+        """ Transforms (..., 3) points from the frame 'source' into the frame
+        'target', in one call.
+
+        If the transformation is a stack of N matrices (moving frames), the
+        points must be a (N, ..., 3) array: the points of each frame are
+        transformed by the matrix of that frame.
+        """
+        transform = self.lookup(target, source)
+
+        if transform.ndim == 2:
+            return geometry.transform_points(points, transform)
+
+        points = np.asarray(points)
+        rotations = transform[:, :3, :3].astype(points.dtype)
+        translations = transform[:, :3, 3].astype(points.dtype)
+
+        # (N, ..., 3) points -> (N, points, 3), to multiply each frame's
+        # points by its matrix
+        flat = points.reshape(len(points), -1, 3)
+        flat = flat @ np.swapaxes(rotations, -1, -2) + translations[:, np.newaxis, :]
+        return flat.reshape(points.shape)
+
+    @staticmethod
+    def _readonly(array):
+        array.setflags(write=False)
+        return array
+
+
+def pinsoro_graph():
+    """ Returns a new graph of the static frames of the PInSoRo setup (to
+    which other frames, eg the heads of the children, can be attached).
+    """
+    graph = TransformGraph()
+
+    graph.add_static(SANDTRAY_CENTRE, SANDTRAY, SANDTRAY_TRANSLATION)
+    graph.add_static(SANDTRAY_CENTRE, camera_frame("purple"), PURPLE_CAM_TO_CENTRE_TRANSLATION, PURPLE_CAM_TO_CENTRE_QUATERNION)
+    graph.add_static(SANDTRAY_CENTRE, camera_frame("yellow"), YELLOW_CAM_TO_CENTRE_TRANSLATION, YELLOW_CAM_TO_CENTRE_QUATERNION)
+
+    return graph
+
+
+DEFAULT_GRAPH = pinsoro_graph()
@@ -0,0 +1,224 @@
+"""
+Conversion between timestamps and frames of the PInSoRo records.
+
+The rows of the ``pinsoro-*.csv`` files are sampled at 30Hz, while the other
+sources of the dataset use timestamps: UNIX timestamps for the annotations
+(``freeplay.annotations.*.yaml``) and the bag files (``start``/``end`` in
+``freeplay.bag.yaml``), seconds from the beginning of the experiment for the
+experimenter's markers (``experiment.yaml``).
+
+A TimeIndex performs a binary search in the (sorted) timestamps of a record
+to turn a time, or a time range, into a frame index, or a slice of frames, in
+O(log n). It also maps the rows of the record to and from the frames of the
+two children-facing video streams (``purple_frame_idx``,
+``yellow_frame_idx``).
+
+Typical usage:
+
+    from framestore import FrameStore
+    from timeindex import TimeIndex
+
+    store = FrameStore("<path to record>/pinsoro-<id>.csv")
+    index = TimeIndex.from_store(store)
+
+    r = index.frames(start, end) # start, end: UNIX timestamps
+    frames = store.range(r.start, r.stop)
+    row = index.frame_at(index.start + 125.) # 2min05s after the first frame
+
+A PlaybackClock replays a range of frames in real time (or faster, or
+slower), by following the wall-clock time rather than counting frames.
+
+License: CC-0
+"""
+
+import time
+import collections
+
+import numpy as np
+
+# value of {purple,yellow}_frame_idx when the video frame is missing
+MISSINGFRAME = -1
+
+
+class TimeIndex:
+    """ Index of the frames of one record, by timestamp.
+
+    :param timestamps: sorted array of the (UNIX) timestamps of the frames
+    :param video_frames: (optional) dictionary {child: array} of the indices
+                         of the video frames corresponding to each row (ie,
+                         the {purple,yellow}_frame_idx fields)
+    """
+
+    def __init__(self, timestamps, video_frames=None):
+
+        self.timestamps = timestamps
+        self.video_frames = video_frames or {}
+
+        # inverse mappings video frame -> row, computed on demand
+        self._rows = {}
+
+    @staticmethod
+    def from_store(store):
+        """ Creates the index of a record from its frame store (cf
+        framestore.py). No data is copied: the index directly searches the
+        memory-mapped timestamps of the store.
+        """
+        video_frames = {child: store.column("%s_frame_idx" % child) for child in ["purple", "yellow"]}
+        return TimeIndex(store.timestamps, video_frames)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def start(self):
+        """ Timestamp of the first frame.
+        """
+        return float(self.timestamps[0])
+
+    @property
+    def end(self):
+        """ Timestamp of the last frame.
+        """
+        return float(self.timestamps[-1])
+
+    def frame_at(self, t):
+        """ Returns the index of the frame displayed at time 't', ie the last
+        frame whose timestamp is lower or equal to 't' (or the first frame, if
+        't' is before the beginning of the record).
+
+        't' can also be an array of timestamps: an array of frame indices is
+        then returned.
+        """
+        idx = np.searchsorted(self.timestamps, t, side='right') - 1
+        return np.maximum(idx, 0)
+
+    def frames(self, start=None, end=None):
+        """ Returns the slice of the frames whose timestamps are in the range
+        [start, end). If 'start' (resp. 'end') is None, the slice starts at the
+        beginning (resp. stops at the end) of the record.
+        """
+        first = 0 if start is None else int(np.searchsorted(self.timestamps, start, side='left'))
+        last = len(self) if end is None else int(np.searchsorted(self.timestamps, end, side='left'))
+        return slice(first, max(first, last))
+
+    def relative(self, seconds, origin=None):
+        """ Converts a time in seconds, relative to 'origin' (a UNIX
+        timestamp; by default the timestamp of the first frame) into a UNIX
+        timestamp.
+
+        For instance, the markers of experiment.yaml are relative to the
+        'timestamp' field of the experiment (in nanoseconds):
+        index.frame_at(index.relative(marker, expe["timestamp"] / 1e9))
+        """
+        if origin is None:
+            origin = self.start
+        return origin + seconds
+
+    def video_frame(self, child, idx):
+        """ Returns the index of the video frame of 'child' ('purple' or
+        'yellow') corresponding to the frame 'idx' of the record, or
+        MISSINGFRAME.
+        """
+        value = self.video_frames[child][idx]
+        return MISSINGFRAME if np.isnan(value) else int(value)
+
+    def frame_of_video(self, child, video_frame):
+        """ Returns the index of the first frame of the record showing the
+        video frame 'video_frame' of 'child', or of the closest following
+        video frame (if 'video_frame' is missing from the record).
+        """
+        if child not in self._rows:
+            video_frames = np.nan_to_num(np.asarray(self.video_frames[child], dtype=np.float64), nan=MISSINGFRAME)
+            # missing frames are replaced by the last valid index, so that
+            # the array is sorted and can be binary-searched
+            self._rows[child] = np.maximum.accumulate(video_frames)
+
+        return int(np.searchsorted(self._rows[child], video_frame, side='left'))
+
+
+class PlaybackClock:
+    """ Real-time playback of the frames [start, stop) of a record.
+
+    Iterating over the clock yields the index of the frame to display
+    (relative to 'start'), ie the frame whose timestamp matches the wall-clock
+    time elapsed since the beginning of the iteration (multiplied by
+    'speed'). When displaying a frame takes longer
+    than the time between two frames, the frames that should have been
+    displayed in the meantime are skipped, so that the playback stays in sync
+    with the recording's timeline. Iteration stops at the end of the range.
+
+    The clock is meant to be used as the 'frames' of a matplotlib
+    FuncAnimation, called every 'interval' milliseconds:
+
+        clock = PlaybackClock(index, start, stop, speed=2.)
+        FuncAnimation(fig, update, clock, interval=clock.interval)
+
+    :param index: the TimeIndex of the record
+    :param speed: playback speed (eg, 0.5, 2, 4)
+    :param fps: maximum display rate (by default, the 30Hz of the recording)
+    """
+
+    # number of displayed frames used to compute the actual display rate
+    FPS_WINDOW = 30
+
+    def __init__(self, index, start, stop, speed=1., fps=30.):
+
+        self.index = index
+        self.start = start
+        self.stop = stop
+        self.speed = speed
+
+        # at low speed, fewer frames need to be displayed per second
+        self.target_fps = fps * min(speed, 1.)
+
+        # wall-clock times of the last displayed frames
+        self._ticks = collections.deque(maxlen=self.FPS_WINDOW)
+
+    @property
+    def interval(self):
+        """ Delay between two displayed frames, in milliseconds.
+        """
+        return 1000. / self.target_fps
+
+    @property
+    def fps(self):
+        """ Actual display rate, averaged over the last FPS_WINDOW frames.
+        """
+        if len(self._ticks) < 2 or self._ticks[-1] == self._ticks[0]:
+            return 0.
+        return (len(self._ticks) - 1) / (self._ticks[-1] - self._ticks[0])
+
+    def times(self):
+        """ Yields the playback time of the frames to display, in seconds
+        from the beginning of the played range (at speed 1, the wall-clock
+        time elapsed since the beginning of the iteration).
+
+        The playback times can be used to synchronise several records on the
+        same clock (cf TimeIndex.frame_at).
+        """
+        timestamps = self.index.timestamps
+        origin = float(timestamps[self.start])
+        # the last frame is displayed for one frame period
+        end = float(timestamps[self.stop]) if self.stop < len(self.index) \
+                else self.index.end + min(self.speed, 1.) / self.target_fps
+        duration = end - origin
+
+        self._ticks.clear()
+
+        starttime = time.monotonic()
+
+        while True:
+            now = time.monotonic()
+            t = (now - starttime) * self.speed
+            if t >= duration:
+                return
+
+            self._ticks.append(now)
+            yield t
+
+    def __iter__(self):
+
+        origin = float(self.index.timestamps[self.start])
+
+        for t in self.times():
+            yield int(self.index.frame_at(origin + t)) - self.start
@@ -0,0 +1,152 @@
+"""
+Light 2D renderer of the PInSoRo records, seen from above the interactive
+table.
+
+The 3D scene of visualise_dataset.py (rendered with mplot3d) is expensive to
+draw. A TopDownPanel only draws, on a plain 2D matplotlib axis, the outline of
+the table and, for each child, the position of the head, the direction of
+the gaze and the point of the table the child is looking at (if any),
+projected on the table plane, together with the current annotations. It is
+cheap enough for many records to be played side by side (cf
+visualise_dataset.py's grid mode), or for hundreds of frames per second to be
+rendered into images (cf render_images).
+
+License: CC-0
+"""
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import geometry
+from scene import DEFAULT_SCENE
+from schema import CHILDREN
+
+COLORS = {"purple": "xkcd:royal purple", "yellow": "xkcd:gold"}
+
+# visible area around the table, in the table reference frame (m)
+XLIM = (-0.4, 0.6)
+YLIM = (-0.6, 0.6)
+
+# length of the gaze segments (m), as in the 3D view
+GAZE_MAGNITUDE = 0.300
+
+
+class TopDownPanel:
+    """ Top-down view of one record, drawn on the 2D matplotlib axis 'ax'.
+
+    The static objects (table outline) are drawn when the panel is created;
+    update() then only changes the data of the dynamic artists, that it
+    returns (so that they can be blitted).
+
+    :param ax: a 2D matplotlib axis
+    :param store: the FrameStore of the record
+    :param title: (optional) title of the panel
+    :param scene: (optional) the static geometry of the setup (cf scene.py)
+    """
+
+    def __init__(self, ax, store, title=None, scene=DEFAULT_SCENE):
+
+        self.ax = ax
+        self.store = store
+
+        self.fields = {child: [store.index["%s_child_%s_%s" % (child, f, c)] for f in ["head", "gaze"] for c in "xyz"]
+                       for child in CHILDREN}
+
+        ax.set_xlim(*XLIM)
+        ax.set_ylim(*YLIM)
+        ax.set_aspect("equal")
+        ax.set_xticks([])
+        ax.set_yticks([])
+        if title:
+            ax.set_title(title, fontsize=8)
+
+        # the interactive table
+        ax.plot(*scene.table[:, :2].T, color="black", linewidth=1)
+
+        self.heads = {child: ax.plot([], [], 'o', markersize=6, color=COLORS[child])[0] for child in CHILDREN}
+        self.gazes = {child: ax.plot([], [], color=COLORS[child])[0] for child in CHILDREN}
+        self.hits = {child: ax.plot([], [], 'x', markersize=8, color=COLORS[child])[0] for child in CHILDREN}
+
+        self.label = ax.text(XLIM[0] + 0.02, YLIM[0] + 0.02, "", fontsize=7, verticalalignment="bottom")
+
+    def annotations(self, idx):
+        """ Returns a short text with the annotations of frame 'idx' (one line
+        per child), or an empty string if the frame is not annotated.
+        """
+        if self.store.label(idx, "annotators") is None:
+            return ""
+
+        lines = []
+        for child in CHILDREN:
+            labels = [self.store.label(idx, "%s_child_%s" % (child, c)) for c in ["task_engagement", "social_engagement", "social_attitude"]]
+            if any(labels):
+                lines.append("%s: %s" % (child[0].upper(), "/".join(l or "-" for l in labels)))
+        return "\n".join(lines)
+
+    def update(self, idx, text=""):
+        """ Displays the frame 'idx' of the record, with 'text' on top of the
+        annotations.
+
+        :returns: the list of the updated artists
+        """
+        row = self.store.frame(idx)
+
+        for child in CHILDREN:
+            head_and_gaze = row[self.fields[child]]
+            hx, hy, _, gx, gy, _ = head_and_gaze
+
+            self.heads[child].set_data([hx], [hy])
+            # the gaze vector is in the table reference frame: projecting it
+            # on the table plane is simply dropping the z coordinate
+            self.gazes[child].set_data([hx, hx + gx * GAZE_MAGNITUDE], [hy, hy + gy * GAZE_MAGNITUDE])
+
+            # where the gaze ray meets the table surface (NaN, hence not
+            # displayed, if it does not)
+            hit = geometry.project_on_plane(head_and_gaze[:3], head_and_gaze[3:])
+            self.hits[child].set_data([hit[0]], [hit[1]])
+
+        annotations = self.annotations(idx)
+        self.label.set_text(text + "\n" + annotations if annotations else text)
+
+        return self.artists()
+
+    def artists(self):
+        """ Returns the dynamic artists of the panel.
+        """
+        return list(self.heads.values()) + list(self.gazes.values()) + list(self.hits.values()) + [self.label]
+
+
+def render_images(store, frames, size=240, text=None):
+    """ Renders top-down views of the frames 'frames' of a record into
+    images, without any display (eg, to generate thumbnails).
+
+    The table is drawn once; for each frame, only the dynamic artists of the
+    panel are drawn on top of a copy of this background (blitting), directly
+    in the Agg buffer.
+
+    :param store: the FrameStore of the record
+    :param frames: iterable of frame indices
+    :param size: width and height of the images, in pixels
+    :param text: (optional) function returning the text to display for a
+                 given frame index
+
+    :returns: a generator of (frame index, (size, size, 3) uint8 RGB image)
+    """
+    dpi = 100
+    fig = Figure(figsize=(size / dpi, size / dpi), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1])
+
+    panel = TopDownPanel(ax, store)
+    for artist in panel.artists():
+        artist.set_animated(True)
+
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+
+    for idx in frames:
+        canvas.restore_region(background)
+        for artist in panel.update(idx, text(idx) if text else ""):
+            ax.draw_artist(artist)
+        yield idx, np.asarray(canvas.buffer_rgba())[..., :3].copy()
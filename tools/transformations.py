@@ -61,7 +61,15 @@ numpy.dot(v, M.T) for shape (\*, 4) "array of points".
 
 Calculations are carried out with numpy.float64 precision.
 
-This Python implementation is not optimized for speed.
+This Python implementation is not optimized for speed. To process many
+transformations at once, batched versions of some functions are provided
+(translation_matrices, compose_matrices, euler_matrices,
+quaternions_from_euler, quaternion_matrices): they take arrays of vectors,
+angles or quaternions (shape (..., n)) and return stacks of matrices (shape
+(..., 4, 4)), without Python loop. Conversely, decompose_matrices,
+euler_from_matrices and quaternion_from_matrices take stacks of matrices,
+quaternion_slerps interpolates between arrays of quaternions, and
+superimposition_matrices aligns many pairs of vector sets at once.
 
 Vector, point, quaternion, and matrix function arguments are expected to be
 "array like", i.e. tuple, list, or numpy arrays.
@@ -205,6 +213,25 @@ def translation_matrix(direction):
     return M
 
 
+def translation_matrices(directions):
+    """Return stack of matrices to translate by an array of direction vectors.
+
+    directions : array of shape (..., 3)
+
+    >>> v = numpy.random.random((10, 3)) - 0.5
+    >>> M = translation_matrices(v)
+    >>> M.shape
+    (10, 4, 4)
+    >>> numpy.array_equal(M[3], translation_matrix(v[3]))
+    True
+
+    """
+    directions = numpy.asarray(directions, dtype=numpy.float64)
+    M = _identity_matrices(directions.shape[:-1])
+    M[..., :3, 3] = directions[..., :3]
+    return M
+
+
 def translation_from_matrix(matrix):
     """Return translation vector from translation matrix.
 
@@ -782,6 +809,90 @@ def decompose_matrix(matrix):
     return scale, shear, angles, translate, perspective
 
 
+def decompose_matrices(matrices):
+    """Return arrays of transformations from a stack of transformation matrices.
+
+    Batched version of decompose_matrix: matrices is an array of shape
+    (..., 4, 4); scale, shear, angles and translate are returned as arrays
+    of shape (..., 3), perspective as an array of shape (..., 4), so that
+    compose_matrices(*decompose_matrices(M)) is M.
+
+    Raise ValueError if any of the matrices is degenerative.
+
+    >>> scale = numpy.random.random((10, 3)) - 0.5
+    >>> angles = (numpy.random.random((10, 3)) - 0.5) * (2*math.pi)
+    >>> trans = numpy.random.random((10, 3)) - 0.5
+    >>> M0 = compose_matrices(scale, None, angles, trans)
+    >>> result = decompose_matrices(M0)
+    >>> numpy.allclose(M0, compose_matrices(*result))
+    True
+    >>> scale, shear, angles, trans, persp = decompose_matrix(M0[3])
+    >>> numpy.allclose(angles, result[2][3])
+    True
+
+    """
+    M = numpy.array(matrices, dtype=numpy.float64, copy=True)
+    M = numpy.swapaxes(M, -1, -2)
+    if numpy.any(numpy.abs(M[..., 3, 3]) < _EPS):
+        raise ValueError("M[3, 3] is zero")
+    M /= M[..., 3:, 3:]
+    # det(P), with P = M and P[:, 3] = 0, 0, 0, 1, is the determinant of
+    # the upper 3x3 block
+    if not numpy.all(numpy.sum(M[..., 0, :3] * numpy.cross(M[..., 1, :3], M[..., 2, :3]), axis=-1)):
+        raise ValueError("Matrix is singular")
+
+    shape = M.shape[:-2]
+    scale = numpy.zeros(shape + (3, ), dtype=numpy.float64)
+    shear = numpy.zeros(shape + (3, ), dtype=numpy.float64)
+    angles = numpy.zeros(shape + (3, ), dtype=numpy.float64)
+
+    perspective = numpy.zeros(shape + (4, ), dtype=numpy.float64)
+    perspective[..., 3] = 1.0
+    projective = numpy.any(numpy.abs(M[..., :3, 3]) > _EPS, axis=-1)
+    if numpy.any(projective):
+        P = M[projective]
+        P[..., :, 3] = 0, 0, 0, 1
+        Pt = numpy.swapaxes(P, -1, -2)
+        perspective[projective] = numpy.matmul(M[projective][..., numpy.newaxis, :, 3],
+                                               numpy.linalg.inv(Pt))[..., 0, :]
+        M[projective, :, 3] = 0, 0, 0, 1
+
+    translate = M[..., 3, :3].copy()
+    M[..., 3, :3] = 0
+
+    row = M[..., :3, :3].copy()
+    scale[..., 0] = vector_norm(row[..., 0, :], axis=-1)
+    row[..., 0, :] /= scale[..., 0, numpy.newaxis]
+    shear[..., 0] = numpy.sum(row[..., 0, :] * row[..., 1, :], axis=-1)
+    row[..., 1, :] -= row[..., 0, :] * shear[..., 0, numpy.newaxis]
+    scale[..., 1] = vector_norm(row[..., 1, :], axis=-1)
+    row[..., 1, :] /= scale[..., 1, numpy.newaxis]
+    shear[..., 0] /= scale[..., 1]
+    shear[..., 1] = numpy.sum(row[..., 0, :] * row[..., 2, :], axis=-1)
+    row[..., 2, :] -= row[..., 0, :] * shear[..., 1, numpy.newaxis]
+    shear[..., 2] = numpy.sum(row[..., 1, :] * row[..., 2, :], axis=-1)
+    row[..., 2, :] -= row[..., 1, :] * shear[..., 2, numpy.newaxis]
+    scale[..., 2] = vector_norm(row[..., 2, :], axis=-1)
+    row[..., 2, :] /= scale[..., 2, numpy.newaxis]
+    shear[..., 1:] /= scale[..., 2, numpy.newaxis]
+
+    flipped = numpy.sum(row[..., 0, :] * numpy.cross(row[..., 1, :], row[..., 2, :]), axis=-1) < 0
+    scale[flipped] *= -1
+    row[flipped] *= -1
+
+    # gimbal lock (cos(angles[1]) == 0) handled with a mask
+    angles[..., 1] = numpy.arcsin(-row[..., 0, 2])
+    regular = numpy.cos(angles[..., 1]) != 0
+    angles[..., 0] = numpy.where(regular,
+                                 numpy.arctan2(row[..., 1, 2], row[..., 2, 2]),
+                                 numpy.arctan2(-row[..., 2, 1], row[..., 1, 1]))
+    angles[..., 2] = numpy.where(regular,
+                                 numpy.arctan2(row[..., 0, 1], row[..., 0, 0]),
+                                 0.0)
+
+    return scale, shear, angles, translate, perspective
+
+
 def compose_matrix(scale=None, shear=None, angles=None, translate=None,
                    perspective=None):
     """Return transformation matrix from sequence of transformations.
@@ -835,6 +946,58 @@ def compose_matrix(scale=None, shear=None, angles=None, translate=None,
     return M
 
 
+def compose_matrices(scale=None, shear=None, angles=None, translate=None,
+                     perspective=None):
+    """Return stack of transformation matrices from arrays of transformations.
+
+    Batched version of compose_matrix: each argument is an array of shape
+    (..., 3) (respectively (..., 4) for perspective), or a single vector
+    shared by all the matrices. The leading dimensions are broadcast.
+
+    >>> scale = numpy.random.random((10, 3)) - 0.5
+    >>> angles = (numpy.random.random((10, 3)) - 0.5) * (2*math.pi)
+    >>> trans = numpy.random.random((10, 3)) - 0.5
+    >>> M = compose_matrices(scale, None, angles, trans)
+    >>> M.shape
+    (10, 4, 4)
+    >>> numpy.allclose(M[3], compose_matrix(scale[3], None, angles[3], trans[3]))
+    True
+
+    """
+    arrays = [numpy.asarray(a, dtype=numpy.float64)
+              for a in (perspective, translate, angles, shear, scale)
+              if a is not None]
+    shape = numpy.broadcast_shapes(*(a.shape[:-1] for a in arrays))
+
+    # M = P.T.R.Z.S, computed as P.(T.((R.Z).S)): the products by the
+    # scale and translation matrices only scale, respectively set,
+    # coefficients of an affine matrix, and are written out
+    if angles is not None:
+        angles = numpy.asarray(angles, dtype=numpy.float64)
+        M = euler_matrices(angles[..., 0], angles[..., 1], angles[..., 2], 'sxyz')
+        if M.shape[:-2] != shape:
+            M = numpy.array(numpy.broadcast_to(M, shape + (4, 4)))
+    else:
+        M = _identity_matrices(shape)
+    if shear is not None:
+        shear = numpy.asarray(shear)
+        Z = _identity_matrices(shape)
+        Z[..., 1, 2] = shear[..., 2]
+        Z[..., 0, 2] = shear[..., 1]
+        Z[..., 0, 1] = shear[..., 0]
+        M = numpy.matmul(M, Z) if angles is not None else Z
+    if scale is not None:
+        M[..., :, :3] *= numpy.asarray(scale)[..., numpy.newaxis, :3]
+    if translate is not None:
+        M[..., :3, 3] = numpy.asarray(translate)[..., :3]
+    if perspective is not None:
+        P = _identity_matrices(shape)
+        P[..., 3, :] = numpy.asarray(perspective)[..., :4]
+        M = numpy.matmul(P, M)
+        M /= M[..., 3:, 3:]
+    return M
+
+
 def orthogonalization_matrix(lengths, angles):
     """Return orthogonalization matrix for crystallographic cell coordinates.
 
@@ -965,6 +1128,90 @@ def superimposition_matrix(v0, v1, scaling=False, usesvd=True):
     return M
 
 
+def superimposition_matrices(v0, v1, scaling=False, usesvd=True):
+    """Return stack of matrices to transform vector sets into other vector sets.
+
+    Batched version of superimposition_matrix: v0 and v1 are arrays of shape
+    (..., 3, n) or (..., 4, n) of sets of at least 3 vectors, whose leading
+    dimensions broadcast together (eg, a single reference set v0 of shape
+    (3, n), and one set v1 per frame). One matrix is returned per pair of
+    sets, as an array of shape (..., 4, 4).
+
+    The SVDs (Kabsch), respectively the eigen decompositions (Horn), of all
+    the covariance matrices are computed at once.
+
+    >>> R = random_rotation_matrix(numpy.random.random(3))
+    >>> v0 = (numpy.random.rand(4, 100) - 0.5) * 20.0
+    >>> v0[3] = 1.0
+    >>> S = scale_matrix(numpy.random.random())
+    >>> T = translation_matrix(numpy.random.random(3)-0.5)
+    >>> M = concatenate_matrices(T, R, S)
+    >>> v1 = numpy.array([numpy.dot(M, v0), numpy.dot(R, v0), v0])
+    >>> M = superimposition_matrices(v0, v1, scaling=True)
+    >>> M.shape
+    (3, 4, 4)
+    >>> numpy.allclose(v1, numpy.matmul(M, v0))
+    True
+    >>> M = superimposition_matrices(v0, v1, scaling=True, usesvd=False)
+    >>> numpy.allclose(v1, numpy.matmul(M, v0))
+    True
+
+    """
+    v0 = numpy.array(v0, dtype=numpy.float64, copy=False)[..., :3, :]
+    v1 = numpy.array(v1, dtype=numpy.float64, copy=False)[..., :3, :]
+
+    if v0.shape[-2:] != v1.shape[-2:] or v0.shape[-1] < 3:
+        raise ValueError("Vector sets are of wrong shape or type.")
+
+    # move centroids to origin
+    t0 = numpy.mean(v0, axis=-1)
+    t1 = numpy.mean(v1, axis=-1)
+    v0 = v0 - t0[..., numpy.newaxis]
+    v1 = v1 - t1[..., numpy.newaxis]
+
+    if usesvd:
+        # Singular Value Decomposition of covariance matrices
+        u, s, vh = numpy.linalg.svd(numpy.matmul(v1, numpy.swapaxes(v0, -1, -2)))
+        # rotation matrices from SVD orthonormal bases
+        R = numpy.matmul(u, vh)
+        # the matrices that do not constitute right handed systems
+        flip = numpy.linalg.det(R) < 0.0
+        R[flip] -= u[flip][..., :, 2, numpy.newaxis] * (vh[flip][..., numpy.newaxis, 2, :] * 2.0)
+        # homogeneous transformation matrices
+        M = numpy.zeros(R.shape[:-2] + (4, 4), dtype=numpy.float64)
+        M[..., :3, :3] = R
+        M[..., 3, 3] = 1.0
+    else:
+        # compute symmetric matrices N
+        xx, yy, zz = numpy.moveaxis(numpy.sum(v0 * v1, axis=-1), -1, 0)
+        xy, yz, zx = numpy.moveaxis(numpy.sum(v0 * numpy.roll(v1, -1, axis=-2), axis=-1), -1, 0)
+        xz, yx, zy = numpy.moveaxis(numpy.sum(v0 * numpy.roll(v1, -2, axis=-2), axis=-1), -1, 0)
+        N = numpy.stack((
+            numpy.stack((xx+yy+zz, yz-zy,    zx-xz,    xy-yx), axis=-1),
+            numpy.stack((yz-zy,    xx-yy-zz, xy+yx,    zx+xz), axis=-1),
+            numpy.stack((zx-xz,    xy+yx,   -xx+yy-zz, yz+zy), axis=-1),
+            numpy.stack((xy-yx,    zx+xz,    yz+zy,   -xx-yy+zz), axis=-1)), axis=-2)
+        # quaternions: eigenvectors corresponding to the most positive
+        # eigenvalues (the last ones, as N is symmetric)
+        l, V = numpy.linalg.eigh(N)
+        q = V[..., :, -1]
+        q = numpy.roll(q, -1, axis=-1) # move w component to end
+        # homogeneous transformation matrices
+        M = quaternion_matrices(q)
+
+    # scale: ratio of rms deviations from centroid
+    if scaling:
+        M[..., :3, :3] *= numpy.sqrt(numpy.sum(v1*v1, axis=(-2, -1)) /
+                                     numpy.sum(v0*v0, axis=(-2, -1)))[..., numpy.newaxis, numpy.newaxis]
+
+    # translation
+    M[..., :3, 3] = t1
+    T = _identity_matrices(t0.shape[:-1])
+    T[..., :3, 3] = -t0
+    M = numpy.matmul(M, T)
+    return M
+
+
 def euler_matrix(ai, aj, ak, axes='sxyz'):
     """Return homogeneous rotation matrix from Euler angles and axis sequence.
 
@@ -1028,6 +1275,67 @@ def euler_matrix(ai, aj, ak, axes='sxyz'):
     return M
 
 
+def euler_matrices(ai, aj, ak, axes='sxyz'):
+    """Return stack of rotation matrices from arrays of Euler angles.
+
+    Batched version of euler_matrix: ai, aj, ak are arrays (of any
+    broadcastable shapes) of roll, pitch and yaw angles; the matrices are
+    returned as an array of shape (..., 4, 4).
+
+    >>> ai, aj, ak = (4.0*math.pi) * (numpy.random.random((3, 10)) - 0.5)
+    >>> for axes in _AXES2TUPLE.keys():
+    ...    R = euler_matrices(ai, aj, ak, axes)
+    ...    if not numpy.allclose(R[3], euler_matrix(ai[3], aj[3], ak[3], axes)):
+    ...        print(axes, "failed")
+    >>> euler_matrices(ai, aj, ak).shape
+    (10, 4, 4)
+
+    """
+    firstaxis, parity, repetition, frame = _axes_tuple(axes)
+
+    i = firstaxis
+    j = _NEXT_AXIS[i+parity]
+    k = _NEXT_AXIS[i-parity+1]
+
+    ai, aj, ak = numpy.broadcast_arrays(*(numpy.asarray(a, dtype=numpy.float64)
+                                          for a in (ai, aj, ak)))
+    if frame:
+        ai, ak = ak, ai
+    if parity:
+        ai, aj, ak = -ai, -aj, -ak
+
+    si, sj, sk = numpy.sin(ai), numpy.sin(aj), numpy.sin(ak)
+    ci, cj, ck = numpy.cos(ai), numpy.cos(aj), numpy.cos(ak)
+    cc, cs = ci*ck, ci*sk
+    sc, ss = si*ck, si*sk
+
+    # the coefficients are filled as (4, 4, ...) arrays, then moved to the
+    # last axes
+    M = numpy.zeros((4, 4) + ai.shape, dtype=numpy.float64)
+    M[3, 3] = 1.0
+    if repetition:
+        M[i, i] = cj
+        M[i, j] = sj*si
+        M[i, k] = sj*ci
+        M[j, i] = sj*sk
+        M[j, j] = -cj*ss+cc
+        M[j, k] = -cj*cs-sc
+        M[k, i] = -sj*ck
+        M[k, j] = cj*sc+cs
+        M[k, k] = cj*cc-ss
+    else:
+        M[i, i] = cj*ck
+        M[i, j] = sj*sc-cs
+        M[i, k] = sj*cc+ss
+        M[j, i] = cj*sk
+        M[j, j] = sj*ss+cc
+        M[j, k] = sj*cs-sc
+        M[k, i] = -sj
+        M[k, j] = cj*si
+        M[k, k] = cj*ci
+    return _matrices_last(M)
+
+
 def euler_from_matrix(matrix, axes='sxyz'):
     """Return Euler angles from rotation matrix for specified axis sequence.
 
@@ -1086,6 +1394,53 @@ def euler_from_matrix(matrix, axes='sxyz'):
     return ax, ay, az
 
 
+def euler_from_matrices(matrices, axes='sxyz'):
+    """Return arrays of Euler angles from a stack of rotation matrices.
+
+    Batched version of euler_from_matrix: matrices is an array of shape
+    (..., 3, 3) or (..., 4, 4); the angles are returned as a tuple of three
+    arrays (ai, aj, ak), so that euler_matrices(*euler_from_matrices(R)) is R.
+
+    >>> ai, aj, ak = (4.0*math.pi) * (numpy.random.random((3, 10)) - 0.5)
+    >>> for axes in _AXES2TUPLE.keys():
+    ...    R0 = euler_matrices(ai, aj, ak, axes)
+    ...    R1 = euler_matrices(*euler_from_matrices(R0, axes), axes=axes)
+    ...    if not numpy.allclose(R0, R1): print(axes, "failed")
+
+    """
+    firstaxis, parity, repetition, frame = _axes_tuple(axes)
+
+    i = firstaxis
+    j = _NEXT_AXIS[i+parity]
+    k = _NEXT_AXIS[i-parity+1]
+
+    M = numpy.asarray(matrices, dtype=numpy.float64)[..., :3, :3]
+    M = numpy.ascontiguousarray(numpy.moveaxis(M, (-2, -1), (0, 1)))
+
+    # the gimbal lock cases (sy, respectively cy, close to zero) are handled
+    # with masks
+    if repetition:
+        sy = numpy.sqrt(M[i, j]*M[i, j] + M[i, k]*M[i, k])
+        regular = sy > _EPS
+        ax = numpy.where(regular, numpy.arctan2( M[i, j],  M[i, k]),
+                                  numpy.arctan2(-M[j, k],  M[j, j]))
+        ay = numpy.arctan2( sy,       M[i, i])
+        az = numpy.where(regular, numpy.arctan2( M[j, i], -M[k, i]), 0.0)
+    else:
+        cy = numpy.sqrt(M[i, i]*M[i, i] + M[j, i]*M[j, i])
+        regular = cy > _EPS
+        ax = numpy.where(regular, numpy.arctan2( M[k, j],  M[k, k]),
+                                  numpy.arctan2(-M[j, k],  M[j, j]))
+        ay = numpy.arctan2(-M[k, i],  cy)
+        az = numpy.where(regular, numpy.arctan2( M[j, i],  M[i, i]), 0.0)
+
+    if parity:
+        ax, ay, az = -ax, -ay, -az
+    if frame:
+        ax, az = az, ax
+    return ax, ay, az
+
+
 def euler_from_quaternion(quaternion, axes='sxyz'):
     """Return Euler angles from quaternion for specified axis sequence.
 
@@ -1154,6 +1509,63 @@ def quaternion_from_euler(ai, aj, ak, axes='sxyz'):
     return quaternion
 
 
+def quaternions_from_euler(ai, aj, ak, axes='sxyz'):
+    """Return array of quaternions from arrays of Euler angles.
+
+    Batched version of quaternion_from_euler: the quaternions are returned
+    as an array of shape (..., 4).
+
+    >>> ai, aj, ak = (4.0*math.pi) * (numpy.random.random((3, 10)) - 0.5)
+    >>> for axes in _AXES2TUPLE.keys():
+    ...    q = quaternions_from_euler(ai, aj, ak, axes)
+    ...    if not numpy.allclose(q[3], quaternion_from_euler(ai[3], aj[3], ak[3], axes)):
+    ...        print(axes, "failed")
+
+    """
+    firstaxis, parity, repetition, frame = _axes_tuple(axes)
+
+    i = firstaxis
+    j = _NEXT_AXIS[i+parity]
+    k = _NEXT_AXIS[i-parity+1]
+
+    ai, aj, ak = numpy.broadcast_arrays(*(numpy.asarray(a, dtype=numpy.float64)
+                                          for a in (ai, aj, ak)))
+    if frame:
+        ai, ak = ak, ai
+    if parity:
+        aj = -aj
+
+    ai = ai / 2.0
+    aj = aj / 2.0
+    ak = ak / 2.0
+    ci = numpy.cos(ai)
+    si = numpy.sin(ai)
+    cj = numpy.cos(aj)
+    sj = numpy.sin(aj)
+    ck = numpy.cos(ak)
+    sk = numpy.sin(ak)
+    cc = ci*ck
+    cs = ci*sk
+    sc = si*ck
+    ss = si*sk
+
+    quaternion = numpy.empty(ai.shape + (4, ), dtype=numpy.float64)
+    if repetition:
+        quaternion[..., i] = cj*(cs + sc)
+        quaternion[..., j] = sj*(cc + ss)
+        quaternion[..., k] = sj*(cs - sc)
+        quaternion[..., 3] = cj*(cc - ss)
+    else:
+        quaternion[..., i] = cj*sc - sj*cs
+        quaternion[..., j] = cj*ss + sj*cc
+        quaternion[..., k] = cj*cs - sj*sc
+        quaternion[..., 3] = cj*cc + sj*ss
+    if parity:
+        quaternion[..., j] *= -1
+
+    return quaternion
+
+
 def quaternion_about_axis(angle, axis):
     """Return quaternion for rotation about axis.
 
@@ -1193,6 +1605,43 @@ def quaternion_matrix(quaternion):
         ), dtype=numpy.float64)
 
 
+def quaternion_matrices(quaternions):
+    """Return stack of rotation matrices from an array of quaternions.
+
+    quaternions : array of shape (..., 4)
+
+    >>> q = numpy.random.random((10, 4)) - 0.5
+    >>> M = quaternion_matrices(q)
+    >>> M.shape
+    (10, 4, 4)
+    >>> numpy.allclose(M[3], quaternion_matrix(q[3]))
+    True
+    >>> numpy.allclose(quaternion_matrices(numpy.zeros((2, 4))), numpy.identity(4))
+    True
+
+    """
+    q = numpy.array(quaternions, dtype=numpy.float64)[..., :4]
+    nq = numpy.sum(q*q, axis=-1)
+    null = nq < _EPS
+    nq[null] = 1.0
+    q *= numpy.sqrt(2.0 / nq)[..., numpy.newaxis]
+    q[null] = 0.0
+    x, y, z, w = numpy.moveaxis(q, -1, 0)
+
+    M = numpy.zeros((4, 4) + nq.shape, dtype=numpy.float64)
+    M[0, 0] = 1.0-y*y-z*z
+    M[0, 1] = x*y-z*w
+    M[0, 2] = x*z+y*w
+    M[1, 0] = x*y+z*w
+    M[1, 1] = 1.0-x*x-z*z
+    M[1, 2] = y*z-x*w
+    M[2, 0] = x*z-y*w
+    M[2, 1] = y*z+x*w
+    M[2, 2] = 1.0-x*x-y*y
+    M[3, 3] = 1.0
+    return _matrices_last(M)
+
+
 def quaternion_from_matrix(matrix):
     """Return quaternion from rotation matrix.
 
@@ -1225,6 +1674,48 @@ def quaternion_from_matrix(matrix):
     return q
 
 
+def quaternion_from_matrices(matrices):
+    """Return array of quaternions from a stack of rotation matrices.
+
+    Batched version of quaternion_from_matrix: matrices is an array of shape
+    (..., 4, 4); the quaternions are returned as an array of shape (..., 4).
+
+    >>> angles = (numpy.random.random((3, 10)) - 0.5) * (2*math.pi)
+    >>> R = euler_matrices(*angles)
+    >>> q = quaternion_from_matrices(R)
+    >>> numpy.allclose(q[3], quaternion_from_matrix(R[3]))
+    True
+    >>> numpy.allclose(quaternion_matrices(q), R)
+    True
+
+    """
+    M = numpy.array(matrices, dtype=numpy.float64, copy=False)[..., :4, :4]
+    M = numpy.ascontiguousarray(numpy.moveaxis(M, (-2, -1), (0, 1)))
+    t = M[0, 0] + M[1, 1] + M[2, 2] + M[3, 3]
+
+    # the four branches of quaternion_from_matrix are computed for all the
+    # matrices, and selected with numpy.choose: the largest diagonal element
+    # (x, y or z), or w if the trace is large enough
+    i = numpy.where(M[1, 1] > M[0, 0], 1, 0)
+    i = numpy.where(M[2, 2] > numpy.where(i == 1, M[1, 1], M[0, 0]), 2, i)
+    i[t > M[3, 3]] = 3
+
+    ts = [None, None, None, t]
+    qs = [None, None, None, (M[2, 1] - M[1, 2], M[0, 2] - M[2, 0], M[1, 0] - M[0, 1], t)]
+    for a, b, c in ((0, 1, 2), (1, 2, 0), (2, 0, 1)):
+        ts[a] = M[a, a] - (M[b, b] + M[c, c]) + M[3, 3]
+        qa = [None] * 4
+        qa[a] = ts[a]
+        qa[b] = M[a, b] + M[b, a]
+        qa[c] = M[c, a] + M[a, c]
+        qa[3] = M[c, b] - M[b, c]
+        qs[a] = qa
+    t = numpy.choose(i, ts)
+    q = numpy.choose(i, [numpy.stack(qa) for qa in qs])
+    q *= 0.5 / numpy.sqrt(t * M[3, 3])
+    return numpy.moveaxis(q, 0, -1).copy()
+
+
 def quaternion_multiply(quaternion1, quaternion0):
     """Return multiplication of two quaternions.
 
@@ -1308,6 +1799,57 @@ def quaternion_slerp(quat0, quat1, fraction, spin=0, shortestpath=True):
     return q0
 
 
+def quaternion_slerps(quat0, quat1, fraction, spin=0, shortestpath=True):
+    """Return spherical linear interpolations between arrays of quaternions.
+
+    Batched version of quaternion_slerp: quat0 and quat1 are arrays of shape
+    (..., 4), fraction an array of shape (...) (or any shapes that broadcast
+    together). The special cases of quaternion_slerp (fraction 0 or 1,
+    identical or opposite quaternions, null angle) are handled with masks.
+
+    >>> q0 = numpy.array([random_quaternion() for _ in range(10)])
+    >>> q1 = numpy.array([random_quaternion() for _ in range(10)])
+    >>> f = numpy.random.random(10)
+    >>> q = quaternion_slerps(q0, q1, f)
+    >>> numpy.allclose(q[3], quaternion_slerp(q0[3], q1[3], f[3]))
+    True
+    >>> numpy.allclose(quaternion_slerps(q0, q1, 0.0), q0)
+    True
+    >>> numpy.allclose(quaternion_slerps(q0, q1, 1.0, 1), q1)
+    True
+
+    """
+    q0 = unit_vector(numpy.asarray(quat0, dtype=numpy.float64)[..., :4], axis=-1)
+    q1 = unit_vector(numpy.asarray(quat1, dtype=numpy.float64)[..., :4], axis=-1)
+    fraction = numpy.asarray(fraction, dtype=numpy.float64)
+    shape = numpy.broadcast_shapes(q0.shape[:-1], q1.shape[:-1], fraction.shape)
+    q0 = numpy.broadcast_to(q0, shape + (4, ))
+    end = numpy.broadcast_to(q1, shape + (4, ))
+    q1 = end.copy()
+    fraction = numpy.broadcast_to(fraction, shape)
+
+    d = numpy.sum(q0 * q1, axis=-1)
+    # q0 is returned if the quaternions are (nearly) identical or opposite
+    same = numpy.abs(numpy.abs(d) - 1.0) < _EPS
+    if shortestpath:
+        # invert rotation
+        opposite = d < 0.0
+        d = numpy.where(opposite, -d, d)
+        q1[opposite] *= -1.0
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        angle = numpy.arccos(d) + spin * math.pi
+        same |= numpy.abs(angle) < _EPS
+        isin = 1.0 / numpy.sin(angle)
+        q = q0 * (numpy.sin((1.0 - fraction) * angle) * isin)[..., numpy.newaxis]
+        q += q1 * (numpy.sin(fraction * angle) * isin)[..., numpy.newaxis]
+
+    q[same] = q0[same]
+    q[fraction == 0.0] = q0[fraction == 0.0]
+    # as in quaternion_slerp, fraction 1 returns quat1, even if opposite
+    q[fraction == 1.0] = end[fraction == 1.0]
+    return q
+
+
 def random_quaternion(rand=None):
     """Return uniform random unit quaternion.
 
@@ -1532,6 +2074,27 @@ _TUPLE2AXES = dict((v, k) for k, v in _AXES2TUPLE.items())
 
 # helper functions
 
+def _axes_tuple(axes):
+    """Return the encoded tuple of an axis sequence (string or tuple)."""
+    try:
+        return _AXES2TUPLE[axes.lower()]
+    except (AttributeError, KeyError):
+        _ = _TUPLE2AXES[axes]
+        return axes
+
+
+def _matrices_last(M):
+    """Return (4, 4, ...) array of matrix coefficients as (..., 4, 4) array."""
+    return numpy.ascontiguousarray(numpy.moveaxis(M, (0, 1), (-2, -1)))
+
+
+def _identity_matrices(shape):
+    """Return array of 4x4 identity matrices of shape shape + (4, 4)."""
+    M = numpy.zeros(tuple(shape) + (4, 4), dtype=numpy.float64)
+    M[..., [0, 1, 2, 3], [0, 1, 2, 3]] = 1.0
+    return M
+
+
 def vector_norm(data, axis=None, out=None):
     """Return length, i.e. eucledian norm, of ndarray along axis.
 
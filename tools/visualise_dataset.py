@@ -14,72 +14,63 @@ License: CC-0
 
 import argparse
 import logging
+import math
+import os
+import sys
+import shutil
+import subprocess
+import tempfile
+import time
+import multiprocessing
 logging.basicConfig(level=logging.INFO)
 
 import numpy as np
-import pandas as pd
-import transformations
+import geometry
+import pinsoro
+from scene import DEFAULT_SCENE
+from framestore import FrameStore, open_corpus
+from topdown import TopDownPanel, render_images
+from timeindex import TimeIndex, PlaybackClock
+from profiling import StageTimer, NullTimer
 
 import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
 import matplotlib.animation as animation
 
 
 # Set up formatting for the movie files
-Writer = animation.writers['ffmpeg']
-writer = Writer(fps=30, metadata=dict(artist='Severin Lemaignan'), bitrate=1800)
+WRITER_OPTIONS = dict(fps=30, metadata=dict(artist='Severin Lemaignan'), bitrate=1800)
 
-START_IDX=0
-SEQ_SIZE=600
+def video_writer():
+    """ Returns a new ffmpeg writer for the videos. ffmpeg is only required
+    when a video is actually saved.
+    """
+    return animation.writers['ffmpeg'](**WRITER_OPTIONS)
 
-IMAGE_WIDTH=0.960 # the orginial images' resolution, in px/1000
-IMAGE_HEIGHT=0.540
+# when exporting a video in parallel, the frames are split into (up to)
+# SHARDS_PER_JOB shards per process, of at least MIN_SHARD_SIZE frames: small
+# enough to balance the load between the processes, large enough for the
+# cost of creating the scene and starting ffmpeg to remain negligible.
+SHARDS_PER_JOB=4
+MIN_SHARD_SIZE=300
 
-SANDTRAY_WIDTH=0.338 #m
-SANDTRAY_LENGTH=0.600 #m
+START_IDX=0
+SEQ_SIZE=600
 
 FPS=30.
 
-LANDMARKS_OFFSET=10 # the index of the first column containing facial landmarks
-LANDMARKS_PADDING=69 # number of fields between the landmarks of the purple child and those of the yellow child
-NUM_FACIAL_LANDMARKS=70 * 2 # 70 X (x,y) values
+# the head pose gizmos of a record are cached next to its frame store, in a
+# '<prefix><GIZMOS_SUFFIX>' file
+GIZMOS_SUFFIX=".gizmos.npy"
 
-# distance from the camera of the 'image plane' where the 2D facial landmarks
-# are plotted
-Z_IMAGE_PLANE = 1. #m
+# used by update() when the rendering is not profiled
+NOTIMER=NullTimer()
 
 
 ################## UTILITIES ####################
 
-# Transformations of 3D points to the centre of the table (common reference
-# frame)
-
-def make_transform_matrix(quaternion, translation):
-    M = np.identity(4)
-    T = transformations.translation_matrix(translation)
-    M = np.dot(M, T)
-    R = transformations.quaternion_matrix(quaternion)
-    M = np.dot(M, R)
-
-    M /= M[3, 3]
-
-    return M
-
-# Obtained with the following steps:
-# $ rosparam set /use_sim_time True
-# $ rosbag play --clock freeplay.bag
-# $ rosrun tf static_transform_publisher -0.3 0.169 0 0 0 0 sandtray_centre sandtray 20
-# $ rosrun tf tf_echo sandtray_centre camera_{purple|yellow}_rgb_optical_frame
-YELLOW_CAM_TO_CENTRE_QUATERNION=[-0.530, 0.220, -0.314, 0.757]
-YELLOW_CAM_TO_CENTRE_TRANSLATION=[-0.408, -0.208, 0.035]
-
-PURPLE_CAM_TO_CENTRE_QUATERNION=[0.220, -0.530, 0.757, -0.314]
-PURPLE_CAM_TO_CENTRE_TRANSLATION=[-0.408, 0.190, 0.035]
-
-# numpy.dot({PURPLE,YELLOW}_CAM_TO_CENTRE, <vector>) transforms
-# a vector <vector> from one of the camera's frame to the centre of the sandtray table frame.
-YELLOW_CAM_TO_CENTRE =  make_transform_matrix(YELLOW_CAM_TO_CENTRE_QUATERNION, YELLOW_CAM_TO_CENTRE_TRANSLATION)
-PURPLE_CAM_TO_CENTRE =  make_transform_matrix(PURPLE_CAM_TO_CENTRE_QUATERNION, PURPLE_CAM_TO_CENTRE_TRANSLATION)
+# The static geometry of the scene (table, cameras and their extrinsics --
+# scene.CAM_TO_CENTRE, cf tfgraph.py --, image planes) is defined, and
+# computed once, in scene.py
 
 
 def project_gaze_on_plane(gaze_origin, gaze_vector, plane):
@@ -88,34 +79,67 @@ def project_gaze_on_plane(gaze_origin, gaze_vector, plane):
     pose ('plane' is a 4x4 transformation matrix, expressed in the
     same (arbitrary) reference frame as gaze_origin).
 
+    'gaze_origin' and 'gaze_vector' can also be (N, 3) arrays, to project
+    the gaze of N frames at once (cf geometry.project_on_plane).
+
     :returns: the [x,y,z] coordinates of the ray intersection, expressed in the
-    'plane' reference frame (as such, the z coordinate should always be 0).
+    'plane' reference frame (as such, the z coordinate should always be 0), or
+    NaN if the ray does not intersect the plane.
     """
 
-    plane_normal = normalize(numpy.dot(plane, [0,0,1,1])[:3])
-    distance_plane_to_origin = 0
+    return geometry.project_on_plane(gaze_origin, gaze_vector, plane)
+
 
-    t = - (numpy.dot(gaze_origin, plane_normal) + distance_plane_to_origin) / (numpy.dot(gaze_vector, plane_normal))
+def precompute_faces(store, start, length, scene=DEFAULT_SCENE):
+    """ Transforms the facial landmarks of the frames [start, start + length)
+    into the common reference frame (centre of the interactive table).
 
-    gaze_projection = gaze_origin + gaze_vector * t
+    All the landmarks of each child are transformed at once, with one single
+    matrix product, so that update() only has to index the result.
 
-    return gaze_projection
+    :return: a dictionary {child: (length, 70, 3) array}
+    """
+    return {child: scene.landmarks_to_table(store.keypoints(child, "face")[start:start + length], child)
+            for child in ["purple", "yellow"]}
+
+def precompute_gizmos(store, start, length):
+    """ Returns the reference gizmos representing the head poses of the two
+    children, for the frames [start, start + length).
 
+    The gizmos of all the frames of the record are computed at once (cf
+    geometry.head_gizmos) the first time the record is played, and cached
+    next to its frame store; they are then memory-mapped.
 
-def idot(a,b):
-    """ This simple helper function is required later as numpy.apply_along_axis does
-    not let us change the order of parameters, and we need
-    np.dot(<transform>, <vector>) and not np.dot(<vector>, <transform>).
+    :return: a dictionary {child: (length, 6, 3) array}
     """
-    return np.dot(b,a)
+    children = ["purple", "yellow"]
+    gizmosfile = store.prefix + GIZMOS_SUFFIX
+
+    if not os.path.exists(gizmosfile):
+        logging.info("Computing the head poses of the whole record (this is only done once)...")
+        gizmos = np.stack([geometry.head_gizmos(np.stack([store.column("%s_child_head_%s" % (child, c)) for c in "xyz"], axis=-1),
+                                                np.stack([store.column("%s_child_head_r%s" % (child, c)) for c in "xyz"], axis=-1))
+                           for child in children])
+
+        tmpfile = pinsoro.tmp_path(gizmosfile)
+        np.save(tmpfile, gizmos)
+        os.replace(tmpfile, gizmosfile)
+
+    gizmos = np.load(gizmosfile, mmap_mode='r')
+
+    return {child: gizmos[i, start:start + length] for i, child in enumerate(children)}
 
 ################## MAIN RENDERING FUNCTIONS ####################
 
-def update(num, data, plots, time_label, ann_labels):
+def update(num, store, faces, gizmos, plots, time_label, ann_labels, clock=None, timer=NOTIMER):
     """ This function is called by matplotlib' AnimationFunc for each frame.
 
     :param num: the frame index
-    :param data: the pandas DataFrame containing the dataset
+    :param store: the (memory-mapped) frame store containing the dataset
+    :param faces: the facial landmarks of the played frames, in the table
+                  reference frame (cf precompute_faces)
+    :param gizmos: the head pose gizmos of the played frames (cf
+                   precompute_gizmos)
     :param plots: the matplotlib 3D plots that we update. This includes the
                   scatter plots of the 2D facial landmarks, the gaze vectors, 
                   the orientation of the heads
@@ -123,193 +147,154 @@ def update(num, data, plots, time_label, ann_labels):
                        index and elapsed time
     :param ann_labels: the matplotlib text objects that we update with the
                        social annotations
+    :param clock: (optional) the PlaybackClock driving the playback, whose
+                  actual and target display rates are shown with the time
+    :param timer: (optional) a profiling.StageTimer, that times the 'data',
+                  'geometry' and 'artists' stages of the update
 
-    :return: nothing. However, the plots and labels are updated.
+    :return: the list of the updated artists (plots and labels), used by
+             matplotlib to only redraw them when blitting.
     """
 
-    ####### Facial landmarks
-
-    # coordinates of the facial landmarks of the purple child, in the purple
-    # camera reference frame
-    purple_face = np.array(
-            # x coordinates (in m) of the facial landmarks of the purple child
-            [IMAGE_WIDTH * data.iloc[START_IDX+num,
-                                     LANDMARKS_OFFSET:LANDMARKS_OFFSET+NUM_FACIAL_LANDMARKS:2] - IMAGE_WIDTH/2,
-            # y coordinates (in m) of the facial landmarks of the purple child
-             IMAGE_HEIGHT * data.iloc[START_IDX+num, 
-                                      LANDMARKS_OFFSET + 1:LANDMARKS_OFFSET + 1 + NUM_FACIAL_LANDMARKS:2] - IMAGE_HEIGHT/2, 
-             # all the 2D points are placed on the same plane
-             [Z_IMAGE_PLANE] * int(NUM_FACIAL_LANDMARKS/2), 
-             # (we need homogenous vectors for transformation)
-             [1]* int(NUM_FACIAL_LANDMARKS/2)]).transpose()
-
-    # transform of the 2D landmarks into the common reference frame (centre of
-    # the interactive table)
-    purple_face_transformed = np.apply_along_axis(idot,1,purple_face,PURPLE_CAM_TO_CENTRE).transpose()
-
-    # update the corresponding matplotlib plot
-    plots[0][0].set_data(purple_face_transformed[0:2,:])
-    plots[0][0].set_3d_properties(purple_face_transformed[2,:])
-
-
-    # same thing for the yellow child
-    stride = NUM_FACIAL_LANDMARKS + LANDMARKS_PADDING
-
-    yellow_face = np.array(
-            [IMAGE_WIDTH*data.iloc[START_IDX+num,
-                                   LANDMARKS_OFFSET + stride:LANDMARKS_OFFSET + stride +NUM_FACIAL_LANDMARKS:2] - IMAGE_WIDTH/2, 
-             IMAGE_HEIGHT*data.iloc[START_IDX+num, 
-                                    LANDMARKS_OFFSET + 1 + stride:LANDMARKS_OFFSET + 1 + stride + NUM_FACIAL_LANDMARKS:2] - IMAGE_HEIGHT/2, 
-             [Z_IMAGE_PLANE] * int(NUM_FACIAL_LANDMARKS/2), 
-             [1]* int(NUM_FACIAL_LANDMARKS/2)]).transpose()
-
-    yellow_face_transformed = np.apply_along_axis(idot,1,yellow_face,YELLOW_CAM_TO_CENTRE).transpose()
-
-    plots[1][0].set_data(yellow_face_transformed[0:2,:])
-    plots[1][0].set_3d_properties(yellow_face_transformed[2,:])
-
-    ###### 3D pose of the purple head
-
-    px = data["purple_child_head_x"][START_IDX+num]
-    py = data["purple_child_head_y"][START_IDX+num]
-    pz = data["purple_child_head_z"][START_IDX+num]
-
-    # the 6D pose estimate is already in the table reference frame; no need to
-    # transform
-
-    plots[2][0].set_data([px, py])
-    plots[2][0].set_3d_properties(pz)
-
-    ###### 3D pose of the yellow head
-
-    yx = data["yellow_child_head_x"][START_IDX+num]
-    yy = data["yellow_child_head_y"][START_IDX+num]
-    yz = data["yellow_child_head_z"][START_IDX+num]
-
-    plots[3][0].set_data([yx, yy])
-    plots[3][0].set_3d_properties(yz)
-
-    ####### Heads orientation
-
-    # to represent the head orientation, we draw a small (red, green, blue)
-    # reference gizmo at the head's origin. To this end, we transform simple
-    # unit vectors x, y, z from the head reference frame to the common table
-    # reference frame.
-
-    xyz_vectors = [[0,0,0,1],[0.1,0,0,1],[0,0,0,1],[0,0.1,0,1],[0,0,0,1],[0,0,0.1,1]]
-
-    # get the head 3D rotation (Euler angles) from the dataset
-    prx = data["purple_child_head_rx"][START_IDX+num]
-    pry = data["purple_child_head_ry"][START_IDX+num]
-    prz = data["purple_child_head_rz"][START_IDX+num]
-
-    yrx = data["yellow_child_head_rx"][START_IDX+num]
-    yry = data["yellow_child_head_ry"][START_IDX+num]
-    yrz = data["yellow_child_head_rz"][START_IDX+num]
-
-    # create the transformation matrices
-    purple_headpose = transformations.compose_matrix(angles=[prx,pry,prz], translate=[px,py,pz])
-    yellow_headpose = transformations.compose_matrix(angles=[yrx,yry,yrz], translate=[yx,yy,yz])
-
-    # apply them to the unit vectors
-    purple_xyz = np.apply_along_axis(idot,1,xyz_vectors,purple_headpose)
-    yellow_xyz = np.apply_along_axis(idot,1,xyz_vectors,yellow_headpose)
-
-    # finally, update each of the plot (each plot is a simple red/green/blue
-    # coloured line, 3 for the purple child, 3 for the yellow child)
-    vx=purple_xyz[0:2].transpose()
-    plots[6][0].set_data(vx[0],vx[1])
-    plots[6][0].set_3d_properties(vx[2])
-
-    vy=purple_xyz[2:4].transpose()
-    plots[7][0].set_data(vy[0],vy[1])
-    plots[7][0].set_3d_properties(vy[2])
-
-    vz=purple_xyz[4:].transpose()
-    plots[8][0].set_data(vz[0],vz[1])
-    plots[8][0].set_3d_properties(vz[2])
-
-    vx=yellow_xyz[0:2].transpose()
-    plots[9][0].set_data(vx[0],vx[1])
-    plots[9][0].set_3d_properties(vx[2])
+    timer.new_frame()
+
+    ################## Data access
+
+    with timer("data"):
+
+        # the row of the frame store holding the current frame (a view on the
+        # memory-mapped store: no copy involved)
+        row = store.frame(START_IDX+num)
+
+        def field(name):
+            return row[store.index[name]]
+
+        # the 6D pose estimate of the heads is already in the table reference
+        # frame; no need to transform
+        px = field("purple_child_head_x")
+        py = field("purple_child_head_y")
+        pz = field("purple_child_head_z")
+
+        yx = field("yellow_child_head_x")
+        yy = field("yellow_child_head_y")
+        yz = field("yellow_child_head_z")
+
+        # the gaze vector origin is at the head's origin.
+        # the gaze vector is already in the table reference frame, so 
+        # we only need to sum (head + gaze)
+        gaze_magnitude = 0.300 #m
+        pgx = field("purple_child_gaze_x") * gaze_magnitude
+        pgy = field("purple_child_gaze_y") * gaze_magnitude
+        pgz = field("purple_child_gaze_z") * gaze_magnitude
+
+        ygx = field("yellow_child_gaze_x") * gaze_magnitude
+        ygy = field("yellow_child_gaze_y") * gaze_magnitude
+        ygz = field("yellow_child_gaze_z") * gaze_magnitude
+
+        # Labels/annotations: first check that annotations are available for
+        # this frame.
+        # When annotations are available, the field 'annotators' contain the names
+        # of the annotators. Otherwise, the store returns None
+        # (the annotation labels are then left unchanged)
+        ann_p_text = ann_y_text = None
+        if store.label(START_IDX+num, "annotators") is not None:
+            time_text = "frame #%d (t=%.1fs)" % (num, num/FPS)
+            ann_p_text = "\n".join(store.label(START_IDX+num, f) or "" for f in ["purple_child_task_engagement",
+                                                                                "purple_child_social_engagement",
+                                                                                "purple_child_social_attitude"])
+
+            # in the child-robot condition, no annotation for the yellow child
+            if store.label(START_IDX+num, "condition") == "childchild":
+                ann_y_text = "\n".join(store.label(START_IDX+num, f) or "" for f in ["yellow_child_task_engagement",
+                                                                                    "yellow_child_social_engagement",
+                                                                                    "yellow_child_social_attitude"])
+            else:
+                ann_y_text = "[robot]"
+        else:
+            time_text = "frame #%d (t=%.1fs) (no annotations)" % (num, num/FPS)
 
-    vy=yellow_xyz[2:4].transpose()
-    plots[10][0].set_data(vy[0],vy[1])
-    plots[10][0].set_3d_properties(vy[2])
+        if clock is not None:
+            time_text += "\n%.1f/%.0f fps (x%g)" % (clock.fps, clock.target_fps, clock.speed)
 
-    vz=yellow_xyz[4:].transpose()
-    plots[11][0].set_data(vz[0],vz[1])
-    plots[11][0].set_3d_properties(vz[2])
+    ################## Geometry
 
-    ###### 3D gaze
+    with timer("geometry"):
 
-    # the gaze vector origin is at the head's origin.
-    # the gaze vector is already in the table reference frame, so 
-    # we only need to sum (head + gaze)
-    gaze_magnitude = 0.300 #m
-    pgx = data["purple_child_gaze_x"][START_IDX+num] * gaze_magnitude
-    pgy = data["purple_child_gaze_y"][START_IDX+num] * gaze_magnitude
-    pgz = data["purple_child_gaze_z"][START_IDX+num] * gaze_magnitude
+        # the facial landmarks of the two children have already been
+        # transformed into the common reference frame (centre of the
+        # interactive table) before the playback (cf precompute_faces): we
+        # only need to pick the current frame
+        purple_face = faces["purple"][num]
+        yellow_face = faces["yellow"][num]
 
-    plots[4][0].set_data([[px,px+pgx],[py,py+pgy]])
-    plots[4][0].set_3d_properties([pz,pz+pgz])
+        # to represent the head orientation, we draw a small (red, green,
+        # blue) reference gizmo at the head's origin, ie simple unit vectors
+        # x, y, z transformed from the head reference frame to the common
+        # table reference frame. The gizmos of all the frames have been
+        # computed before the playback (cf precompute_gizmos): we only need to
+        # pick the current frame, and split it into the 3 segments
+        segments = [gizmos[child][num][2 * axis:2 * axis + 2].transpose()
+                    for child in ["purple", "yellow"] for axis in range(3)]
 
-    ygx = data["yellow_child_gaze_x"][START_IDX+num] * gaze_magnitude
-    ygy = data["yellow_child_gaze_y"][START_IDX+num] * gaze_magnitude
-    ygz = data["yellow_child_gaze_z"][START_IDX+num] * gaze_magnitude
+    ################## Artists
 
-    plots[5][0].set_data([[yx,yx+ygx],[yy,yy+ygy]])
-    plots[5][0].set_3d_properties([yz,yz+ygz])
+    with timer("artists"):
 
+        ####### Facial landmarks
+        plots[0][0].set_data(purple_face[:, 0], purple_face[:, 1])
+        plots[0][0].set_3d_properties(purple_face[:, 2])
 
+        plots[1][0].set_data(yellow_face[:, 0], yellow_face[:, 1])
+        plots[1][0].set_3d_properties(yellow_face[:, 2])
 
+        ###### 3D pose of the heads
+        plots[2][0].set_data([px], [py])
+        plots[2][0].set_3d_properties([pz])
 
-    ################## Labels/annotations
+        plots[3][0].set_data([yx], [yy])
+        plots[3][0].set_3d_properties([yz])
 
-    ann_p_label, ann_y_label = ann_labels
+        ####### Heads orientation
+        # each plot is a simple red/green/blue coloured line, 3 for the purple
+        # child, 3 for the yellow child
+        for i, segment in enumerate(segments):
+            plots[6 + i][0].set_data(segment[0], segment[1])
+            plots[6 + i][0].set_3d_properties(segment[2])
 
-    # first check that annotations are available for this frame.
-    # When annotations are available, the field 'annotators' contain the names
-    # of the annotators. Otherwise, pandas returns 'nan'
-    if isinstance(data["annotators"][START_IDX+num], str):
-        time_label.set_text("frame #%d (t=%.1fs)" % (num, num/FPS))
-        ann_p_label.set_text(data.iloc[START_IDX+num,-6] + "\n" + \
-                             data.iloc[START_IDX+num,-5] + "\n" + \
-                             data.iloc[START_IDX+num,-4])
+        ###### 3D gaze
+        plots[4][0].set_data([[px,px+pgx],[py,py+pgy]])
+        plots[4][0].set_3d_properties([pz,pz+pgz])
 
-        # in the child-robot condition, no annotation for the yellow child
-        if data["condition"][START_IDX+num] == "childchild":
-            ann_y_label.set_text(data.iloc[START_IDX+num,-3] + "\n" + \
-                                 data.iloc[START_IDX+num,-2] + "\n" + \
-                                 data.iloc[START_IDX+num,-1])
-        else:
-            ann_y_label.set_text("[robot]")
-    else:
-        time_label.set_text("frame #%d (t=%.1fs) (no annotations)" % (num, num/FPS))
-    return plots
+        plots[5][0].set_data([[yx,yx+ygx],[yy,yy+ygy]])
+        plots[5][0].set_3d_properties([yz,yz+ygz])
 
-################ MAIN ###################
+        ################## Labels/annotations
+        ann_p_label, ann_y_label = ann_labels
 
-if __name__ == "__main__":
+        time_label.set_text(time_text)
+        if ann_p_text is not None:
+            ann_p_label.set_text(ann_p_text)
+        if ann_y_text is not None:
+            ann_y_label.set_text(ann_y_text)
 
-    parser = argparse.ArgumentParser(description='PInSoRo Dataset -- Dataset player')
-    parser.add_argument("-i", "--start-idx", type=int, default=0, help="Start frame")
-    parser.add_argument("-l", "--length", type=int, help="# of frames to display (default: full dataset)")
-    parser.add_argument("--video", nargs="?", help="If set, save the animation as a video with given filename")
-    parser.add_argument("path", help="path to the dataset")
+    return dynamic_artists(plots, time_label, ann_labels)
 
-    args = parser.parse_args()
+def dynamic_artists(plots, time_label, ann_labels):
+    """ Returns the artists updated at each frame by update().
 
-    START_IDX=args.start_idx
-    SEQ_SIZE=args.length
+    Passed (as is) as the 'init_func' of the FuncAnimations: matplotlib then
+    does not call update() to draw the initial frame, so that only the frames
+    actually rendered are timed.
+    """
+    return [p[0] for p in plots] + [time_label] + ann_labels
 
-    # we are using pandas to read the CSV file. pandas is several order of
-    # magnitude faster than Python's own CSV library
-    logging.info("Loading dataset...")
-    data=pd.read_csv(args.path)
-    logging.info("Done loading.")
+def create_scene(scene=DEFAULT_SCENE):
+    """ Creates the matplotlib figure: the static scene objects (table,
+    cameras, image planes, as computed once by 'scene') and the empty plots of
+    the dynamic objects, that are then updated at each frame by update().
 
-    # create and configure the matplotlib plot
+    :returns: (fig, ax, plots, time_label, ann_labels)
+    """
     fig = plt.figure()
     ax = fig.add_subplot(111, projection='3d')
     ax.set_proj_type('persp')
@@ -324,6 +309,10 @@ if __name__ == "__main__":
     ax.set_ylabel('Y (m)')
     ax.set_zlabel('Z (m)')
 
+    # 3D axes do not accept a numerical aspect ratio (matplotlib >= 3.6): the
+    # box of the scene is scaled to the ranges of its axes instead
+    ax.set_box_aspect([hi - lo for lo, hi in (ax.get_xlim3d(), ax.get_ylim3d(), ax.get_zlim3d())])
+
     # place the 3D camera so that the 2 children' faces are visible
     ax.azim=-170
     ax.elev=18
@@ -333,40 +322,19 @@ if __name__ == "__main__":
     # First, we draw all the static scene objects:
 
     # draw the interactive table
-    ax.plot([-SANDTRAY_LENGTH/2, -SANDTRAY_LENGTH/2, SANDTRAY_LENGTH/2, SANDTRAY_LENGTH/2, -SANDTRAY_LENGTH/2],
-            [-SANDTRAY_WIDTH/2, SANDTRAY_WIDTH/2, SANDTRAY_WIDTH/2, -SANDTRAY_WIDTH/2, -SANDTRAY_WIDTH/2],
-            0, color="black")
+    ax.plot(*scene.table.T, color="black")
 
     # draw the main axes of the scene
-    ax.plot([0,0.100],[0,0],[0,0], color="red")
-    ax.plot([0,0],[0,0.100],[0,0], color="green")
-    ax.plot([0,0],[0,0],[0,0.100], color="blue")
+    for axis, c in zip(scene.axes, ["red", "green", "blue"]):
+        ax.plot(*axis.T, color=c)
 
     # draw the 2 cameras
-    cw = 0.05 # width of the camera
-    ch= cw * 1. *  IMAGE_HEIGHT/IMAGE_WIDTH # height of the camera, keeping the image's aspect ratio
-    cz = Z_IMAGE_PLANE / IMAGE_WIDTH * (cw*2)
-    camera = [[0, cw,-cw,0,cw,-cw,0,cw,cw,-cw,-cw],
-              [0,ch,ch,0,-ch,-ch,0,-ch,ch,ch,-ch],
-              [0, cz,cz,0,cz,cz,0,cz,cz,cz,cz],
-              [1]*11]
-    purple_camera = np.apply_along_axis(idot,0,camera,PURPLE_CAM_TO_CENTRE)
-    yellow_camera = np.apply_along_axis(idot,0,camera,YELLOW_CAM_TO_CENTRE)
-
-    ax.plot(*purple_camera[0:3], color=colors[0])
-    ax.plot(*yellow_camera[0:3], color=colors[1])
+    ax.plot(*scene.cameras["purple"].T, color=colors[0])
+    ax.plot(*scene.cameras["yellow"].T, color=colors[1])
 
     # draw the image plane of the 2 cameras (plan of the 2D facial landmarks)
-    image_plane = [[-IMAGE_WIDTH/2, IMAGE_WIDTH/2, IMAGE_WIDTH/2, -IMAGE_WIDTH/2, -IMAGE_WIDTH/2],
-                   [-IMAGE_HEIGHT/2, -IMAGE_HEIGHT/2, IMAGE_HEIGHT/2, IMAGE_HEIGHT/2, -IMAGE_HEIGHT/2],
-                   [Z_IMAGE_PLANE]*5,
-                   [1]*5]
-
-    purple_image_plane = np.apply_along_axis(idot,0,image_plane,PURPLE_CAM_TO_CENTRE)
-    yellow_image_plane = np.apply_along_axis(idot,0,image_plane,YELLOW_CAM_TO_CENTRE)
-
-    ax.plot(*purple_image_plane[0:3])
-    ax.plot(*yellow_image_plane[0:3])
+    ax.plot(*scene.image_planes["purple"].T)
+    ax.plot(*scene.image_planes["yellow"].T)
 
     # Then, we prepare empty plots for all the dynamic objects:
 
@@ -390,14 +358,384 @@ if __name__ == "__main__":
 
     ann_labels=[ann_p_text,ann_y_text]
 
-    # Finally, we create the Animation object
-    line_ani = animation.FuncAnimation(fig, update, SEQ_SIZE, fargs=(data, plots, time_text, ann_labels),
-                                    interval=1000/FPS, blit=False, repeat=False)
+    return fig, ax, plots, time_text, ann_labels
+
+def profile_drawing(timer, fig, *axes):
+    """ Times the drawing of the figure as the 'draw' stage of 'timer' (a
+    profiling.StageTimer): the complete redraws of the figure (at each frame
+    when not blitting, and when saving a video frame), as well as the redraws
+    of the moving objects of 'axes' only, when blitting.
+    """
+    fig.draw = timer.wrap("draw", fig.draw)
+    for ax in axes:
+        ax.draw_artist = timer.wrap("draw", ax.draw_artist)
+
+################## VIDEO EXPORT ####################
+
+def render_shard(shard):
+    """ Renders (headless, with the Agg backend) the frames [first, last) of
+    the played sequence into the video file 'filename'.
+
+    This is the worker of export_video, run in its own process: it opens the
+    frame store and creates the scene itself.
+
+    :param shard: (path, cachedir, start_idx, length, first, last, filename,
+                  profile)
+    :returns: (number of rendered frames, rendering time in seconds, timings
+              of the rendering stages if 'profile' is True, None otherwise)
+    """
+    global START_IDX, SEQ_SIZE
+
+    path, cachedir, START_IDX, SEQ_SIZE, first, last, filename, profile = shard
+
+    plt.switch_backend("Agg")
+
+    starttime = time.time()
+
+    store = FrameStore(path, cachedir=cachedir)
+    faces = precompute_faces(store, START_IDX, SEQ_SIZE)
+    gizmos = precompute_gizmos(store, START_IDX, SEQ_SIZE)
+
+    fig, ax, plots, time_text, ann_labels = create_scene()
+
+    timer = StageTimer() if profile else NOTIMER
+    profile_drawing(timer, fig, ax)
+
+    # the frames are numbered from the beginning of the played sequence (and
+    # not of the shard), so that the time label is the same as when the whole
+    # sequence is rendered at once
+    line_ani = animation.FuncAnimation(fig, update, range(first, last), fargs=(store, faces, gizmos, plots, time_text, ann_labels, None, timer),
+                                       init_func=lambda: dynamic_artists(plots, time_text, ann_labels),
+                                       interval=1000/FPS, repeat=False)
+    line_ani.save(filename, writer=video_writer())
+    plt.close(fig)
+    timer.finish()
+
+    return last - first, time.time() - starttime, timer.timings if profile else None
+
+
+def concatenate_videos(filenames, output):
+    """ Joins the video files 'filenames' (encoded with the same settings)
+    into 'output', with ffmpeg's concat demuxer. The streams are copied, not
+    re-encoded: the joining is lossless, and fast.
+    """
+    listfile = os.path.join(os.path.dirname(filenames[0]), "shards.txt")
+    with open(listfile, 'w') as f:
+        for filename in filenames:
+            f.write("file '%s'\n" % os.path.abspath(filename))
+
+    subprocess.check_call([plt.rcParams['animation.ffmpeg_path'],
+                           "-y", "-loglevel", "error",
+                           "-f", "concat", "-safe", "0", "-i", listfile,
+                           "-c", "copy", output])
+
+
+def export_video(path, cachedir, output, jobs, timer=NOTIMER):
+    """ Renders the frames [START_IDX, START_IDX + SEQ_SIZE) of the record
+    'path' into the video file 'output', using 'jobs' processes.
+
+    The sequence is split into time shards that are rendered and encoded
+    independently (cf render_shard), by a pool of processes; the resulting
+    pieces are then joined into the final video (cf concatenate_videos).
+
+    If 'timer' is a profiling.StageTimer, the timings of the rendering
+    stages measured by the workers are collected into it.
+    """
+    nb_shards = max(1, min(jobs * SHARDS_PER_JOB, SEQ_SIZE // MIN_SHARD_SIZE))
+    bounds = np.linspace(0, SEQ_SIZE, nb_shards + 1).astype(int)
+
+    _, ext = os.path.splitext(output)
+    tmpdir = tempfile.mkdtemp(prefix=".pinsoro-video-", dir=os.path.dirname(os.path.abspath(output)))
+    filenames = [os.path.join(tmpdir, "shard%04d%s" % (i, ext)) for i in range(nb_shards)]
+
+    profile = not isinstance(timer, NullTimer)
+    shards = [(path, cachedir, START_IDX, SEQ_SIZE, first, last, filename, profile)
+              for first, last, filename in zip(bounds[:-1], bounds[1:], filenames)]
+
+    logging.info("Rendering %d frames in %d shards, with %d processes..." % (SEQ_SIZE, nb_shards, jobs))
+
+    starttime = time.time()
+    nb_frames = 0
+
+    try:
+        with multiprocessing.Pool(jobs) as pool:
+            for i, (frames, duration, timings) in enumerate(pool.imap_unordered(render_shard, shards), 1):
+                nb_frames += frames
+                if timings is not None:
+                    timer.merge(timings)
+                elapsed = time.time() - starttime
+                logging.info("%d/%d shards rendered (%d/%d frames, %.1f%%) -- %.1f frames/s (this shard: %.1f frames/s)" % \
+                                (i, nb_shards, nb_frames, SEQ_SIZE, 100. * nb_frames / SEQ_SIZE, nb_frames / elapsed, frames / duration))
+
+        logging.info("Joining the shards into %s..." % output)
+        concatenate_videos(filenames, output)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    elapsed = time.time() - starttime
+    logging.info("Video exported in %.1fs (%.1f frames/s, %.1fx real-time)" % (elapsed, SEQ_SIZE / elapsed, SEQ_SIZE / FPS / elapsed))
+
+################## GRID PLAYBACK ####################
+
+def play_grid(paths, start_time=None, end_time=None, video=None, speed=1., realtime=True, blit=True, cachedir=None, timer=NOTIMER):
+    """ Plays several records side by side, in a grid of light top-down
+    views (cf topdown.TopDownPanel), all driven by the same clock. With a
+    single record, this is the fast 2D alternative to the 3D view.
+
+    The records are synchronised on the time elapsed since their beginning
+    (or since 'start_time', in seconds): each panel displays, at each tick
+    of the clock, the frame of its record corresponding to the current
+    playback time. The frames are read from the memory-mapped frame stores of
+    the records: nothing is loaded in memory beforehand.
+
+    :param paths: the paths to the pinsoro-*.csv files of the records
+    :param start_time, end_time: the played range, in seconds from the
+                                 beginning of each record
+    :param video: if set, the grid is saved as a video with this filename,
+                  instead of being displayed
+    """
+    stores = open_corpus(paths, cachedir=cachedir)
+    indices = [TimeIndex.from_store(store) for store in stores]
+
+    ranges = [index.frames(index.relative(start_time or 0), None if end_time is None else index.relative(end_time))
+              for index in indices]
+
+    # records that end before 'start_time' have no frame to play: their
+    # panel only shows when they ended
+    finished = [r.start >= r.stop for r in ranges]
+    if all(finished):
+        logging.error("No frame to play: all the records end before t=%.1fs" % (start_time or 0))
+        return
+
+    origins = [float(index.timestamps[r.start]) if not done else index.end
+               for index, r, done in zip(indices, ranges, finished)]
+
+    # the clock follows the longest record
+    durations = [float(index.timestamps[r.stop - 1]) - origin if not done else 0.
+                 for index, r, origin, done in zip(indices, ranges, origins, finished)]
+    master = int(np.argmax(durations))
+
+    ncols = int(math.ceil(math.sqrt(len(stores))))
+    nrows = int(math.ceil(len(stores) / ncols))
+
+    size = max(3., 8. / ncols) # inches per panel
+    fig, axes = plt.subplots(nrows, ncols, figsize=(size * ncols, 1.2 * size * nrows), squeeze=False)
+    panels = [TopDownPanel(ax, store, title=store.label(0, "id")) for ax, store in zip(axes.flat, stores)]
+    for ax in axes.flat[len(stores):]:
+        ax.axis("off")
+    for panel, index, done in zip(panels, indices, finished):
+        if done:
+            panel.label.set_text("record ended at t=%.1fs" % (index.end - index.start))
+    fig.tight_layout()
+
+    profile_drawing(timer, fig, *axes.flat)
+
+    # the actual display rate is shown on the first played panel
+    first_played = finished.index(False)
+
+    def update_grid(t, clock=None):
+        timer.new_frame()
+
+        text = "t=%.1fs" % ((start_time or 0) + t)
+        artists = []
+
+        with timer("panels"):
+            for i, (panel, index, r, origin, done) in enumerate(zip(panels, indices, ranges, origins, finished)):
+                if done:
+                    continue
+                # records shorter than the longest one stay on their last frame
+                idx = min(max(int(index.frame_at(origin + t)), r.start), r.stop - 1)
+                if clock is not None and i == first_played:
+                    artists += panel.update(idx, text + " -- %.1f/%.0f fps (x%g)" % (clock.fps, clock.target_fps, clock.speed))
+                else:
+                    artists += panel.update(idx, text)
+
+        return artists
+
+    def played_artists():
+        # cf dynamic_artists: the initial frame is not drawn by update_grid
+        return [artist for panel, done in zip(panels, finished) if not done for artist in panel.artists()]
+
+    if video is not None:
+        # every frame is rendered in the video
+        times = np.arange(0, durations[master], 1. / FPS)
+        grid_ani = animation.FuncAnimation(fig, update_grid, times, init_func=played_artists, interval=1000/FPS, repeat=False)
+
+        print("Generating video... please be patient...")
+        grid_ani.save(video, writer=video_writer())
+    else:
+        clock = PlaybackClock(indices[master], ranges[master].start, ranges[master].stop, speed=speed, fps=FPS)
+        if realtime:
+            frames = clock.times
+        else:
+            frames = np.arange(0, durations[master], 1. / FPS)
+
+        grid_ani = animation.FuncAnimation(fig, update_grid, frames, fargs=(clock if realtime else None,), init_func=played_artists,
+                                           interval=clock.interval if realtime else 1000/FPS/speed,
+                                           blit=blit, repeat=False, cache_frame_data=False)
+        plt.show()
+
+    timer.finish()
+
+
+def export_thumbnails(store, directory, start, length, every=1., size=240):
+    """ Saves top-down views (cf topdown.render_images) of the frames [start,
+    start + length) of a record, one every 'every' seconds, as PNG images in
+    'directory'.
+    """
+    index = TimeIndex.from_store(store)
+
+    times = np.arange(float(index.timestamps[start]), float(index.timestamps[start + length - 1]), every)
+    frames = np.unique(index.frame_at(times))
+
+    os.makedirs(directory, exist_ok=True)
+    name = store.label(0, "id") or "frame"
+
+    logging.info("Rendering %d thumbnails into %s..." % (len(frames), directory))
+    starttime = time.time()
+
+    for idx, image in render_images(store, frames, size, text=lambda idx: "t=%.1fs" % (float(index.timestamps[idx]) - index.start)):
+        plt.imsave(os.path.join(directory, "%s-%06d.png" % (name, idx)), image)
+
+    elapsed = time.time() - starttime
+    logging.info("%d thumbnails saved in %.1fs (%.1f thumbnails/s)" % (len(frames), elapsed, len(frames) / elapsed if elapsed else 0.))
+
+
+def report_timings(timer, path=None):
+    """ Prints the summary of the timings of the rendering stages (if
+    profiling is enabled), and optionally saves them to the CSV file 'path'.
+    """
+    if isinstance(timer, NullTimer):
+        return
+
+    print("Rendering timings:")
+    print(timer.summary())
+    print("\nDistribution of the durations of each stage:")
+    print(timer.histograms())
+
+    if path is not None:
+        timer.save(path)
+        logging.info("Timings of each frame saved to %s" % path)
+
+################ MAIN ###################
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='PInSoRo Dataset -- Dataset player')
+    parser.add_argument("-i", "--start-idx", type=int, default=0, help="Start frame")
+    parser.add_argument("-l", "--length", type=int, help="# of frames to display (default: full dataset)")
+    parser.add_argument("--start-time", type=float, help="Start time, in seconds from the beginning of the record (overrides --start-idx)")
+    parser.add_argument("--end-time", type=float, help="End time, in seconds from the beginning of the record (overrides --length)")
+    parser.add_argument("--renderer", choices=["3d", "2d"], default="3d", help="'3d': full 3D scene (default); '2d': fast top-down view of the table (heads, gaze and gaze hits)")
+    parser.add_argument("--thumbnails", help="if set, saves top-down views of the record as PNG images in this directory, instead of playing it")
+    parser.add_argument("--thumbnail-every", type=float, default=1., help="with --thumbnails, time between two thumbnails, in seconds (default: 1s)")
+    parser.add_argument("--video", nargs="?", help="If set, save the animation as a video with given filename")
+    parser.add_argument("-j", "--jobs", type=int, default=multiprocessing.cpu_count(), help="with --video, number of processes rendering the video in parallel (default: one per CPU core)")
+    parser.add_argument("--speed", type=float, default=1., help="playback speed (eg, 0.5, 2, 4)")
+    parser.add_argument("--no-realtime", action='store_true', help="display every frame, even if the rendering can not keep up with the recording's frame rate (by default, frames are skipped to stay in sync with the recording's timeline)")
+    parser.add_argument("--no-blit", action='store_true', help="redraw the whole scene at each frame, instead of only the moving objects (slower, but might be needed with older versions of matplotlib)")
+    parser.add_argument("--profile", action='store_true', help="time each stage of the rendering (data access, geometry, matplotlib artists update, drawing), and print a summary at the end of the playback or video export")
+    parser.add_argument("--profile-output", help="with --profile, also save the timings of each frame to this CSV file")
+    parser.add_argument("--cache-dir", help="where to store the binary caches of the dataset (default: a .pinsoro-cache directory next to the CSV file)")
+    parser.add_argument("path", nargs="+", help="path to the dataset record (pinsoro-*.csv). If several records are given, they are played side by side, in a grid of top-down views (only --start-time and --end-time are then used to select the played range)")
+
+    args = parser.parse_args()
+
+    timer = StageTimer() if args.profile else NOTIMER
+
+    if len(args.path) > 1:
+        play_grid(args.path, args.start_time, args.end_time, args.video,
+                  speed=args.speed, realtime=not args.no_realtime, blit=not args.no_blit,
+                  cachedir=args.cache_dir, timer=timer)
+        report_timings(timer, args.profile_output)
+        sys.exit(0)
+
+    path = args.path[0]
+
+    START_IDX=args.start_idx
+    SEQ_SIZE=args.length
+
+    # the first time a record is opened, the CSV file is parsed (with pandas,
+    # which is several order of magnitude faster than Python's own CSV
+    # library) and converted into a memory-mapped frame store (cf
+    # framestore.py). Opening the record again is then instantaneous, and
+    # only the frames actually displayed are read from disk.
+    logging.info("Loading dataset...")
+    store=FrameStore(path, cachedir=args.cache_dir)
+    logging.info("Done loading.")
+
+    # convert the start/end times into frame indices
+    index = TimeIndex.from_store(store)
+    if args.start_time is not None:
+        START_IDX = index.frames(index.relative(args.start_time)).start
+    if args.end_time is not None:
+        SEQ_SIZE = index.frames(index.relative(args.start_time or 0), index.relative(args.end_time)).stop - START_IDX
+
+    if SEQ_SIZE is None:
+        SEQ_SIZE = len(store) - START_IDX
+
+    if args.thumbnails is not None:
+        export_thumbnails(store, args.thumbnails, START_IDX, SEQ_SIZE, args.thumbnail_every)
+        sys.exit(0)
+
+    if args.renderer == "2d":
+        # the 2D renderer is a grid of one single top-down panel
+        start_time = float(index.timestamps[START_IDX]) - index.start
+        end_time = float(index.timestamps[START_IDX + SEQ_SIZE]) - index.start if START_IDX + SEQ_SIZE < len(index) else None
+        play_grid([path], start_time, end_time, args.video,
+                  speed=args.speed, realtime=not args.no_realtime, blit=not args.no_blit,
+                  cachedir=args.cache_dir, timer=timer)
+        report_timings(timer, args.profile_output)
+        sys.exit(0)
+
+    if args.video is not None and args.jobs > 1:
+        # the video is rendered in parallel, by time shards: each worker
+        # process opens the record and creates the scene on its own
+        export_video(path, args.cache_dir, args.video, args.jobs, timer)
+        report_timings(timer, args.profile_output)
+        sys.exit(0)
+
+    logging.info("Computing the scene geometry...")
+    faces = precompute_faces(store, START_IDX, SEQ_SIZE)
+    gizmos = precompute_gizmos(store, START_IDX, SEQ_SIZE)
+
+    fig, ax, plots, time_text, ann_labels = create_scene()
+    profile_drawing(timer, fig, ax)
 
     if args.video is not None:
+        # every frame is rendered in the video
+        line_ani = animation.FuncAnimation(fig, update, SEQ_SIZE, fargs=(store, faces, gizmos, plots, time_text, ann_labels, None, timer),
+                                        init_func=lambda: dynamic_artists(plots, time_text, ann_labels),
+                                        interval=1000/FPS, repeat=False)
+
         print("Generating video... please be patient...")
 
-        ax.set_aspect(540/960.)
-        line_ani.save(args.video, writer=writer)
+        line_ani.save(args.video, writer=video_writer())
     else:
+        # Finally, we create the Animation object.
+        # The frames are scheduled by a playback clock that follows the
+        # wall-clock time: if a frame takes longer than 1/FPS to render, the
+        # next frames are skipped so that the playback stays in sync with the
+        # recording's timeline (cf timeindex.PlaybackClock).
+        # When blitting, the static scene (table, cameras, image planes) is
+        # rendered once into a cached background; at each frame, only the
+        # artists returned by update() (that matplotlib then flags as 'animated')
+        # are redrawn on top of it. The background is captured again whenever the
+        # 3D view is rotated or zoomed.
+        if args.no_realtime:
+            clock = None
+            frames = SEQ_SIZE
+            interval = 1000/FPS/args.speed
+        else:
+            clock = PlaybackClock(index, START_IDX, START_IDX + SEQ_SIZE, speed=args.speed, fps=FPS)
+            frames = clock
+            interval = clock.interval
+
+        line_ani = animation.FuncAnimation(fig, update, frames, fargs=(store, faces, gizmos, plots, time_text, ann_labels, clock, timer),
+                                        init_func=lambda: dynamic_artists(plots, time_text, ann_labels),
+                                        interval=interval, blit=not args.no_blit, repeat=False, cache_frame_data=False)
+
         plt.show()
+
+    timer.finish()
+    report_timings(timer, args.profile_output)